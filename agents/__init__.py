@@ -1,7 +1,23 @@
-"""Agents package"""
+"""Agents package
 
-from .weather_agent import WeatherAgent
-from .location_agent import LocationAgent
-from .cost_agent import CostAgent
+The agents are imported on first access (`from agents import WeatherAgent`
+or `agents.CostAgent`), so importing one submodule does not load the others.
+"""
+import importlib
 
 __all__ = ["WeatherAgent", "LocationAgent", "CostAgent"]
+
+_LAZY = {"WeatherAgent": "weather_agent", "LocationAgent": "location_agent", "CostAgent": "cost_agent"}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
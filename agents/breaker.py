@@ -0,0 +1,158 @@
+"""Per-upstream circuit breakers.
+
+Each upstream (Nominatim, Open-Meteo, the model endpoint) gets a breaker that
+watches a rolling window of its recent calls. When too many of them failed or
+were slow, the circuit opens and calls fail fast with `CircuitOpen` so the
+caller can switch to its fallback straight away instead of waiting out
+timeouts and retries. After `open_for` seconds a single probe call is let
+through (half-open): success closes the circuit, failure opens it again.
+Client errors (4xx other than 429, see `is_upstream_failure`) mean the
+upstream answered and do not count against it.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict
+
+from agents.metrics import incr
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# per upstream: calls slower than `slow_call_s` count against the circuit like errors
+BREAKER_DEFAULTS: Dict[str, dict] = {
+    "nominatim": {"slow_call_s": 3.0},
+    "open-meteo": {"slow_call_s": 3.0},
+    "llm": {"slow_call_s": 8.0},
+}
+
+
+class CircuitOpen(RuntimeError):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, failure_ratio: float = 0.5,
+                 slow_call_s: float = 5.0, slow_ratio: float = 0.8, open_for: float = 30.0):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_call_s = slow_call_s
+        self.slow_ratio = slow_ratio
+        self.open_for = open_for
+        self.state = CLOSED
+        self.opened = 0
+        self.rejected = 0
+        self._calls = deque(maxlen=window)  # (failed, slow) per call
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; an open circuit lets one probe through after `open_for`."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_for:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+        self.count_rejection()
+        return False
+
+    def count_rejection(self):
+        """Account for a call the caller skipped because the circuit was open."""
+        with self._lock:
+            self.rejected += 1
+        incr("planner_breaker_rejections_total", upstream=self.name)
+
+    def rejecting(self) -> bool:
+        """True while the circuit is open and not yet due for a probe (no side effects)."""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self._opened_at < self.open_for
+
+    def record(self, failed: bool, seconds: float):
+        slow = seconds >= self.slow_call_s
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if failed or slow:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self._calls.clear()
+                return
+            self._calls.append((failed, slow))
+            n = len(self._calls)
+            if self.state == CLOSED and n >= self.min_calls:
+                failures = sum(1 for f, _ in self._calls if f)
+                slows = sum(1 for _, s in self._calls if s)
+                if failures / n >= self.failure_ratio or slows / n >= self.slow_ratio:
+                    self._open()
+
+    def _open(self):
+        # caller holds the lock
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.opened += 1
+        self._calls.clear()
+        incr("planner_breaker_opened_total", upstream=self.name)
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Run `fn` through the breaker, raising `CircuitOpen` without calling it when open."""
+        if not self.allow():
+            raise CircuitOpen(f"{self.name} circuit is open")
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.record(is_upstream_failure(e), time.monotonic() - start)
+            raise
+        self.record(False, time.monotonic() - start)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = len(self._calls)
+            return {
+                "state": self.state,
+                "window_calls": n,
+                "window_failures": sum(1 for f, _ in self._calls if f),
+                "window_slow": sum(1 for _, s in self._calls if s),
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Whether `error` counts against the circuit: anything but a client error status (4xx other than 429)."""
+    status = getattr(error, "status", None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status != 429)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """The process-wide breaker for upstream `name`, created on first use."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(name, **BREAKER_DEFAULTS.get(name, {}))
+    return breaker
+
+
+def configure_breaker(name: str, **kwargs) -> CircuitBreaker:
+    """Replace the breaker for `name` with one built from `kwargs`."""
+    with _lock:
+        breaker = _breakers[name] = CircuitBreaker(name, **{**BREAKER_DEFAULTS.get(name, {}), **kwargs})
+    return breaker
+
+
+def breaker_stats() -> Dict[str, dict]:
+    with _lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.stats() for b in breakers}
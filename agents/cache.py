@@ -0,0 +1,162 @@
+"""Small persistent caches shared by the agents.
+
+`SqliteTTLCache` is a key/value store on disk (one SQLite file, one table per
+namespace) with per-entry expiry and size-bounded LRU eviction. `SingleFlight`
+collapses concurrent calls for the same key into one in-flight computation.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from agents.metrics import incr
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ai-agent")
+
+
+def cache_path(filename: str) -> str:
+    """Return the on-disk path for a cache file, honouring `AGENT_CACHE_DIR`."""
+    directory = os.environ.get("AGENT_CACHE_DIR") or DEFAULT_CACHE_DIR
+    if directory != ":memory:":
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, filename)
+    return ":memory:"
+
+
+def normalize_place(place_name: str) -> str:
+    """Canonical cache key for a place string ("  Jakarta ,Indonesia" -> "jakarta, indonesia")."""
+    parts = [" ".join(part.split()) for part in place_name.casefold().split(",")]
+    return ", ".join(part for part in parts if part)
+
+
+_MISSING = object()
+
+
+class SqliteTTLCache:
+    """JSON values in SQLite with TTL expiry and LRU eviction past `max_entries`.
+
+    With `stale_ttl`, expired entries are kept that much longer and can still
+    be read with `get(key, allow_stale=True)`, e.g. while an upstream is down.
+    Expired and overflowing entries are swept every `evict_every` writes, so
+    the table can briefly hold up to `evict_every` entries past `max_entries`.
+    """
+
+    def __init__(self, path: str, namespace: str = "cache", ttl: float = 3600.0, max_entries: int = 10000,
+                 stale_ttl: float = 0.0, evict_every: int = 256):
+        self.path = path
+        self.table = "".join(c for c in namespace if c.isalnum() or c == "_") or "cache"
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_lru ON {self.table}(last_access)")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_expiry ON {self.table}(expires_at)")
+
+    def get(self, key: str, default: Any = None, allow_stale: bool = False) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < (now - self.stale_ttl if allow_stale else now):
+                self.misses += 1
+                result = "miss"
+            else:
+                self._conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                result = "hit" if row[1] >= now else "stale"
+        incr("planner_cache_requests_total", cache=self.table, result=result)
+        return default if result == "miss" else json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, expires_at: Optional[float] = None):
+        now = time.time()
+        if expires_at is None:
+            expires_at = now + (self.ttl if ttl is None else ttl)
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, now),
+            )
+            self._writes += 1
+            if self._writes >= self.evict_every:
+                self._evict(now)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses, "max_entries": self.max_entries}
+
+    def _evict(self, now: float):
+        # caller holds the lock
+        self._writes = 0
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now - self.stale_ttl,))
+        count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+
+
+class SingleFlight:
+    """Run `fn` once per key at a time; concurrent callers share the result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, "_Call"] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = _MISSING
+        self.error: Optional[BaseException] = None
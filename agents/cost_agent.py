@@ -2,13 +2,21 @@
 
 Provides rough cost estimates for transport, hotel, and attraction tickets.
 """
+import importlib.util
 from math import radians, sin, cos, sqrt, atan2
-from typing import List
+from typing import List, Sequence, Tuple
+
+# optional: vectorized distance matrices; numpy is imported on first use
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+EARTH_RADIUS_KM = 6371.0
+# below this distance trips are priced as local transport
+LOCAL_TRIP_KM = 5
 
 
 def haversine(lat1, lon1, lat2, lon2):
     # returns distance in kilometers
-    R = 6371.0
+    R = EARTH_RADIUS_KM
     dlat = radians(lat2 - lat1)
     dlon = radians(lon2 - lon1)
     a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
@@ -16,13 +24,32 @@ def haversine(lat1, lon1, lat2, lon2):
     return R * c
 
 
+def distance_matrix(origins: Sequence[Tuple[float, float]], destinations: Sequence[Tuple[float, float]]):
+    """Great-circle distances in km between every origin and destination.
+
+    Returns an `len(origins) x len(destinations)` NumPy array computed in one
+    broadcast pass (a list of lists if NumPy is not installed), matching
+    `haversine` pair by pair.
+    """
+    if not NUMPY_AVAILABLE:
+        return [[haversine(o[0], o[1], d[0], d[1]) for d in destinations] for o in origins]
+    import numpy as np
+
+    o = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    d = np.radians(np.asarray(destinations, dtype=float).reshape(-1, 2))
+    lat1, lon1 = o[:, 0:1], o[:, 1:2]
+    lat2, lon2 = d[:, 0], d[:, 1]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
 class CostAgent:
     @staticmethod
     def estimate_transport(origin_coords, dest_coords):
         # very rough per-km cost estimates in USD
         km = haversine(origin_coords[0], origin_coords[1], dest_coords[0], dest_coords[1])
         # If distance small, assume local transport; long -> intercity
-        if km < 5:
+        if km < LOCAL_TRIP_KM:
             taxi = max(1.5 * km, 2.0)
             bus = max(0.5 * km, 1.0)
         else:
@@ -37,6 +64,30 @@ class CostAgent:
         }
         return transport
 
+    @staticmethod
+    def estimate_transport_many(origins, destinations):
+        """`estimate_transport` for every origin x destination pair in one pass.
+
+        Returns a dict of `len(origins) x len(destinations)` nested lists with
+        the same keys and rounding as `estimate_transport`.
+        """
+        if not NUMPY_AVAILABLE:
+            rows = [[CostAgent.estimate_transport(o, d) for d in destinations] for o in origins]
+            return {key: [[cell[key] for cell in row] for row in rows]
+                    for key in ("distance_km", "taxi_usd", "bus_usd", "suggested_mode")}
+        import numpy as np
+
+        km = np.asarray(distance_matrix(origins, destinations))
+        local = km < LOCAL_TRIP_KM
+        taxi = np.where(local, np.maximum(1.5 * km, 2.0), 0.6 * km)
+        bus = np.where(local, np.maximum(0.5 * km, 1.0), 0.25 * km)
+        return {
+            "distance_km": np.round(km, 2).tolist(),
+            "taxi_usd": np.round(taxi, 2).tolist(),
+            "bus_usd": np.round(bus, 2).tolist(),
+            "suggested_mode": np.where(bus < taxi, "bus", "taxi").tolist(),
+        }
+
     @staticmethod
     def estimate_hotel(nights=1, quality="mid"):
         # simple tiers
@@ -72,11 +123,23 @@ class CostAgent:
         transport = CostAgent.estimate_transport(origin_coords, dest_coords)
         hotel = CostAgent.estimate_hotel(nights=nights, quality=hotel_tier)
         tickets = CostAgent.estimate_tickets(recommended_places)
+        return CostAgent.breakdown(transport, hotel, tickets)
 
+    @staticmethod
+    def breakdown(transport: dict, hotel: dict, tickets: dict, local_transport: dict = None):
+        """Assemble the cost block; `local_transport` (an itinerary) adds its per-leg taxi fares."""
+        local_usd = local_transport.get("taxi_usd", 0) if local_transport else 0
         breakdown = {
             "transport": transport,
             "hotel": hotel,
             "tickets": tickets,
-            "grand_total_usd": round(transport.get("taxi_usd", 0) + hotel["total_usd"] + tickets["total_usd"], 2),
+            "grand_total_usd": round(transport.get("taxi_usd", 0) + hotel["total_usd"] + tickets["total_usd"] + local_usd, 2),
         }
+        if local_transport:
+            breakdown["local_transport"] = {
+                "legs": len(local_transport.get("stops", [])),
+                "distance_km": local_transport.get("distance_km"),
+                "taxi_usd": local_transport.get("taxi_usd"),
+                "bus_usd": local_transport.get("bus_usd"),
+            }
         return breakdown
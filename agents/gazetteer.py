@@ -0,0 +1,197 @@
+"""Offline gazetteer geocoder.
+
+Builds a compact, sorted index of normalized place names from a GeoNames-style
+dump (e.g. `cities15000.txt`) once, then answers exact and prefix lookups by
+binary search over a memory-mapped file: nothing is loaded up front and every
+worker process shares the same page cache.
+
+Usage examples:
+  python -m agents.gazetteer build cities15000.txt gazetteer.idx --country-info countryInfo.txt
+  python -m agents.gazetteer lookup gazetteer.idx "yogyakarta, indonesia"
+
+Set `GAZETTEER_PATH` to the built index to have `WeatherAgent.geocode_place`
+consult it before the cache and Nominatim.
+"""
+import argparse
+import logging
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from agents.cache import normalize_place
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"GAZ1"
+KEY_WIDTH = 64
+_HEADER = struct.Struct("<4sIH")
+# key, lat, lon, population, ISO country code
+_RECORD = struct.Struct(f"<{KEY_WIDTH}sddQ2s")
+
+
+def _read_country_names(path: str) -> Dict[str, str]:
+    names = {}
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if line.startswith("#") or not line.strip():
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) > 4:
+                names[cols[0]] = cols[4]
+    return names
+
+
+def _keys(name: str, country: Optional[str]) -> Iterable[bytes]:
+    base = normalize_place(name)
+    for key in (base, f"{base}, {normalize_place(country)}" if country else None):
+        if key:
+            raw = key.encode("utf-8")
+            if len(raw) <= KEY_WIDTH:
+                yield raw
+
+
+def build_index(dump_path: str, out_path: str, country_info: Optional[str] = None, min_population: int = 0) -> int:
+    """Build an index from a GeoNames-format dump; returns the number of records written.
+
+    Each place is indexed under its name and ASCII name, and, when
+    `country_info` (GeoNames `countryInfo.txt`) is given, also as
+    "name, country". Duplicate keys keep the most populous place first.
+    """
+    countries = _read_country_names(country_info) if country_info else {}
+    records: Dict[bytes, Tuple[float, float, int, bytes]] = {}
+    with open(dump_path, encoding="utf-8") as fh:
+        for line in fh:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15:
+                continue
+            try:
+                lat, lon = float(cols[4]), float(cols[5])
+                population = int(cols[14] or 0)
+            except ValueError:
+                continue
+            if population < min_population:
+                continue
+            cc = cols[8][:2]
+            for name in {cols[1], cols[2]}:
+                for key in _keys(name, countries.get(cc)):
+                    best = records.get(key)
+                    if best is None or population > best[2]:
+                        records[key] = (lat, lon, population, cc.encode("ascii", "replace"))
+
+    tmp = out_path + ".tmp"
+    with open(tmp, "wb") as out:
+        out.write(_HEADER.pack(MAGIC, len(records), KEY_WIDTH))
+        for key in sorted(records):
+            lat, lon, population, cc = records[key]
+            out.write(_RECORD.pack(key, lat, lon, population, cc))
+    os.replace(tmp, out_path)
+    return len(records)
+
+
+class Gazetteer:
+    """Read-only view over a built index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, width = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or width != KEY_WIDTH:
+            raise ValueError(f"{path} is not a gazetteer index")
+
+    def _key_at(self, i: int) -> bytes:
+        off = _HEADER.size + i * _RECORD.size
+        return self._mm[off:off + KEY_WIDTH].rstrip(b"\0")
+
+    def _record(self, i: int) -> dict:
+        key, lat, lon, population, cc = _RECORD.unpack_from(self._mm, _HEADER.size + i * _RECORD.size)
+        return {"name": key.rstrip(b"\0").decode("utf-8"), "lat": lat, "lon": lon,
+                "population": population, "country_code": cc.decode("ascii")}
+
+    def _lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, place_name: str) -> Optional[Tuple[float, float]]:
+        """Exact match on the normalized name; returns (lat, lon) or None."""
+        key = normalize_place(place_name).encode("utf-8")
+        if not key or len(key) > KEY_WIDTH:
+            return None
+        i = self._lower_bound(key)
+        if i < self.count and self._key_at(i) == key:
+            rec = self._record(i)
+            return rec["lat"], rec["lon"]
+        return None
+
+    def prefix(self, text: str, limit: int = 10) -> List[dict]:
+        """Up to `limit` places whose normalized name starts with `text`, most populous first."""
+        key = normalize_place(text).encode("utf-8")
+        if not key:
+            return []
+        matches = []
+        i = self._lower_bound(key)
+        while i < self.count and self._key_at(i).startswith(key):
+            matches.append(self._record(i))
+            i += 1
+        matches.sort(key=lambda r: -r["population"])
+        return matches[:limit]
+
+    def close(self):
+        self._mm.close()
+
+
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_loaded = False
+_lock = threading.Lock()
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """The index named by `GAZETTEER_PATH`, opened once per process (None if unset or unreadable)."""
+    global _gazetteer, _gazetteer_loaded
+    if not _gazetteer_loaded:
+        with _lock:
+            if not _gazetteer_loaded:
+                path = os.environ.get("GAZETTEER_PATH")
+                try:
+                    _gazetteer = Gazetteer(path) if path else None
+                except (OSError, ValueError, struct.error) as e:
+                    # geocoding carries on through the cache and Nominatim
+                    logger.error("Cannot open gazetteer %s (%s); offline geocoding disabled", path, e)
+                    _gazetteer = None
+                _gazetteer_loaded = True
+    return _gazetteer
+
+
+def main():
+    p = argparse.ArgumentParser(prog="python -m agents.gazetteer")
+    sub = p.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="build an index from a GeoNames dump")
+    b.add_argument("dump")
+    b.add_argument("out")
+    b.add_argument("--country-info", help="GeoNames countryInfo.txt, to index 'name, country' keys")
+    b.add_argument("--min-population", type=int, default=0)
+    q = sub.add_parser("lookup", help="exact and prefix lookup against an index")
+    q.add_argument("index")
+    q.add_argument("name")
+    args = p.parse_args()
+
+    if args.command == "build":
+        n = build_index(args.dump, args.out, country_info=args.country_info, min_population=args.min_population)
+        print(f"wrote {n} keys to {args.out}")
+    else:
+        gz = Gazetteer(args.index)
+        print("exact:", gz.lookup(args.name))
+        for rec in gz.prefix(args.name):
+            print("prefix:", rec)
+
+
+if __name__ == "__main__":
+    main()
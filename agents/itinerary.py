@@ -0,0 +1,153 @@
+"""Itinerary ordering for recommended places.
+
+Places are geocoded (through the cached geocoder, unless they already carry
+`lat`/`lon`), a distance matrix is built once, and visits are ordered slot by
+slot (morning, then afternoon, then evening) with a nearest-neighbour tour
+improved by 2-opt. Free-form `best_time` answers ("Morning", "late afternoon",
+"sunset") are mapped to a slot by keyword; places without a recognisable one
+are inserted wherever they add the least distance. Each leg is priced with `CostAgent`.
+"""
+import logging
+import re
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from agents.cost_agent import CostAgent, distance_matrix
+
+logger = logging.getLogger(__name__)
+
+TIME_SLOTS = ("morning", "afternoon", "evening")
+# keywords that place a free-form best_time in a slot; the earliest match in the text wins
+SLOT_KEYWORDS = {
+    "morning": ("morning", "sunrise", "dawn", "breakfast"),
+    "afternoon": ("afternoon", "midday", "noon", "lunch", "daytime"),
+    "evening": ("evening", "sunset", "dusk", "night", "dinner"),
+}
+_SLOT_PATTERN = re.compile(
+    r"\b(" + "|".join(k for keys in SLOT_KEYWORDS.values() for k in keys) + r")\b")
+_SLOT_OF = {k: slot for slot, keys in SLOT_KEYWORDS.items() for k in keys}
+
+
+def time_slot(best_time: Optional[str]) -> Optional[str]:
+    """The slot (`TIME_SLOTS`) a model's `best_time` answer refers to, or None."""
+    if not isinstance(best_time, str):
+        return None
+    m = _SLOT_PATTERN.search(best_time.casefold())
+    return _SLOT_OF[m.group(1)] if m else None
+
+
+def _nearest_neighbour(dist: List[List[float]], start: int, nodes: List[int]) -> List[int]:
+    path, remaining, current = [], set(nodes), start
+    while remaining:
+        row = dist[current]
+        current = min(remaining, key=row.__getitem__)
+        remaining.remove(current)
+        path.append(current)
+    return path
+
+
+def _two_opt(dist: List[List[float]], start: int, path: List[int]) -> List[int]:
+    """Improve an open path leaving `start` by segment reversals until no move helps."""
+    route = [start] + path
+    n = len(route)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = route[i - 1], route[i]
+            for j in range(i + 1, n):
+                c = route[j]
+                d = route[j + 1] if j + 1 < n else None
+                before = dist[a][b] + (dist[c][d] if d is not None else 0.0)
+                after = dist[a][c] + (dist[b][d] if d is not None else 0.0)
+                if after < before - 1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    a, b = route[i - 1], route[i]
+                    improved = True
+    return route[1:]
+
+
+def _cheapest_insertion(dist: List[List[float]], start: int, route: List[int], node: int) -> List[int]:
+    full = [start] + route
+    best_pos, best_cost = len(full), dist[full[-1]][node]
+    for k in range(1, len(full)):
+        prev, nxt = full[k - 1], full[k]
+        cost = dist[prev][node] + dist[node][nxt] - dist[prev][nxt]
+        if cost < best_cost:
+            best_pos, best_cost = k, cost
+    full.insert(best_pos, node)
+    return full[1:]
+
+
+def order_stops(start: Tuple[float, float], points: Sequence[Tuple[float, float]], slots: Sequence[Optional[str]]) -> List[int]:
+    """Visit order (indices into `points`) from `start`, respecting time-of-day slots."""
+    slots = [time_slot(s) for s in slots]
+    dist = distance_matrix([start] + list(points), [start] + list(points))
+    dist = dist.tolist() if hasattr(dist, "tolist") else dist
+    route: List[int] = []
+    current = 0
+    for slot in TIME_SLOTS:
+        group = [i + 1 for i, s in enumerate(slots) if s == slot]
+        if not group:
+            continue
+        leg = _two_opt(dist, current, _nearest_neighbour(dist, current, group))
+        route.extend(leg)
+        current = leg[-1]
+    for i, s in enumerate(slots):
+        if s not in TIME_SLOTS:
+            route = _cheapest_insertion(dist, 0, route, i + 1)
+    return [node - 1 for node in route]
+
+
+def _default_geocoder(destination: str) -> Callable[[str], Tuple[float, float]]:
+    from agents.weather_agent import WeatherAgent
+
+    return lambda name: WeatherAgent.geocode_place(f"{name}, {destination}")
+
+
+def plan_itinerary(places: List[dict], start: Tuple[float, float], destination: str,
+                   geocoder: Optional[Callable[[str], Tuple[float, float]]] = None) -> Dict:
+    """Order `places` into a day route from `start` and price every leg.
+
+    Places that cannot be located are listed under `unplaced` and left out
+    of the route.
+    """
+    geocoder = geocoder or _default_geocoder(destination)
+    located, unplaced = [], []
+    for p in places:
+        if p.get("lat") is not None and p.get("lon") is not None:
+            located.append((p, (float(p["lat"]), float(p["lon"]))))
+            continue
+        try:
+            located.append((p, geocoder(p.get("name", ""))))
+        except Exception as e:
+            logger.debug("Could not locate %s: %s", p.get("name"), e)
+            unplaced.append(p.get("name"))
+
+    order = order_stops(start, [c for _, c in located], [p.get("best_time") for p, _ in located]) if located else []
+
+    stops = []
+    prev = start
+    total_km = taxi = bus = 0.0
+    for idx in order:
+        place, coords = located[idx]
+        leg = CostAgent.estimate_transport(prev, coords)
+        total_km += leg["distance_km"]
+        taxi += leg["taxi_usd"]
+        bus += leg["bus_usd"]
+        stops.append({
+            "name": place.get("name"),
+            "type": place.get("type"),
+            "best_time": place.get("best_time"),
+            "lat": coords[0],
+            "lon": coords[1],
+            "leg": leg,
+        })
+        prev = coords
+
+    return {
+        "stops": stops,
+        "unplaced": unplaced,
+        "distance_km": round(total_km, 2),
+        "taxi_usd": round(taxi, 2),
+        "bus_usd": round(bus, 2),
+    }
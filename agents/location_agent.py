@@ -3,24 +3,97 @@
 Uses a generative model (Gemini) when available to suggest recommended spots
 based on weather. Falls back to a heuristic generator if no model/key is configured.
 
-This version includes basic session & memory integration (InMemorySessionService)
+This version includes basic session & memory integration (see agents.session)
 and logging for observability.
 """
+import contextvars
+import importlib.util
 import os
-from typing import List
+import threading
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import List, Optional, Tuple
 import logging
 
 try:
-    # optional: google generative ai client
-    import google.generativeai as genai
-    GENAI_AVAILABLE = True
-except Exception:
+    # optional: google generative ai client, imported on first use (it is slow to import)
+    GENAI_AVAILABLE = importlib.util.find_spec("google.generativeai") is not None
+except (ImportError, ValueError):
     GENAI_AVAILABLE = False
 
-from agents.session import InMemorySessionService
+from agents.breaker import get_breaker
+from agents.cache import SqliteTTLCache, cache_path, normalize_place
+from agents.metrics import span
+from agents.session import get_session_service
 
 logger = logging.getLogger(__name__)
 
+MODEL_NAME = "gemini-2.0-flash"
+
+# Model answers are cached per destination and weather bucket rather than per
+# prompt: nearby temperatures with the same umbrella level get the same places.
+TEMP_BAND_EDGES = (10, 18, 24, 28, 32)
+TEMP_BAND_LABELS = ("cold", "cool", "mild", "warm", "hot", "very_hot")
+RECOMMENDATION_CACHE_TTL = 7 * 24 * 3600
+RECOMMENDATION_CACHE_MAX_ENTRIES = 5000
+
+_recommendation_cache = None
+# model calls raced against the heuristic (see LocationAgent.hedged) run here
+_model_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm")
+_configured_key: Optional[str] = None
+_lock = threading.Lock()
+
+
+def temperature_band(temp_max) -> str:
+    if temp_max is None:
+        return "unknown"
+    return TEMP_BAND_LABELS[bisect_right(TEMP_BAND_EDGES, temp_max)]
+
+
+def weather_bucket(weather: dict) -> Tuple[str, str]:
+    """(temperature band, umbrella level) used to key cached recommendations."""
+    return temperature_band(weather.get("temp_max")), weather.get("umbrella_recommendation") or "unknown"
+
+
+def get_recommendation_cache() -> SqliteTTLCache:
+    global _recommendation_cache
+    if _recommendation_cache is None:
+        with _lock:
+            if _recommendation_cache is None:
+                _recommendation_cache = SqliteTTLCache(
+                    cache_path("recommendations.sqlite"),
+                    namespace="recommendations",
+                    ttl=RECOMMENDATION_CACHE_TTL,
+                    max_entries=RECOMMENDATION_CACHE_MAX_ENTRIES,
+                )
+    return _recommendation_cache
+
+
+def _api_key() -> Optional[str]:
+    return os.environ.get("GOOGLE_API_KEY") or os.environ.get("GENAI_API_KEY")
+
+
+def _model_endpoint() -> Optional[str]:
+    # an HTTP endpoint taking {"model", "prompt"} and answering {"text"}, e.g. a
+    # self-hosted proxy or the benchmark's stand-in server
+    return os.environ.get("LLM_ENDPOINT")
+
+
+def model_available() -> bool:
+    return bool(_model_endpoint()) or (GENAI_AVAILABLE and bool(_api_key()))
+
+
+def _configure_genai(api_key: str):
+    # configure the client once per process (and again only if the key changes)
+    global _configured_key
+    if _configured_key != api_key:
+        with _lock:
+            if _configured_key != api_key:
+                import google.generativeai as genai
+
+                genai.configure(api_key=api_key)
+                _configured_key = api_key
+
 
 class LocationAgent:
     @staticmethod
@@ -38,15 +111,29 @@ class LocationAgent:
         return prompt
 
     @staticmethod
+    @span("llm")
     def call_gemini(prompt: str) -> List[dict]:
         # This function attempts to call Google Generative API (gemini-2.0-flash)
-        api_key = os.environ.get("GOOGLE_API_KEY") or os.environ.get("GENAI_API_KEY")
-        if not GENAI_AVAILABLE or not api_key:
-            raise RuntimeError("Generative AI client not available or API key missing")
-        # configure client; actual usage may vary by installed SDK version
-        genai.configure(api_key=api_key)
-        resp = genai.generate_text(model="gemini-2.0-flash", prompt=prompt)
-        text = resp.text if hasattr(resp, "text") else str(resp)
+        endpoint = _model_endpoint()
+        if endpoint:
+            from agents.transport import get_transport
+
+            def generate():
+                return get_transport().post_json(endpoint, {"model": MODEL_NAME, "prompt": prompt}).get("text", "")
+        else:
+            api_key = _api_key()
+            if not GENAI_AVAILABLE or not api_key:
+                raise RuntimeError("Generative AI client not available or API key missing")
+            # configure client; actual usage may vary by installed SDK version
+            _configure_genai(api_key)
+
+            def generate():
+                import google.generativeai as genai
+
+                resp = genai.generate_text(model=MODEL_NAME, prompt=prompt)
+                return resp.text if hasattr(resp, "text") else str(resp)
+        # an open circuit raises CircuitOpen at once and callers fall back to the heuristic
+        text = get_breaker("llm").call(generate)
         # Try to parse JSON from model output
         import json
 
@@ -59,6 +146,7 @@ class LocationAgent:
             return []
 
     @staticmethod
+    @span("heuristic")
     def heuristic(destination: str, weather: dict) -> List[dict]:
         # Simple rules based on umbrella recommendation and temperature
         umbrella = weather.get("umbrella_recommendation", "unknown")
@@ -92,14 +180,85 @@ class LocationAgent:
         return spots
 
     @staticmethod
-    def run(weather_data: dict, destination: str) -> List[dict]:
-        # Try real model first if configured, record results in session memory
-        session_id = InMemorySessionService.create_session({"destination": destination, "date": weather_data.get("date")})
-        prompt = LocationAgent.prompt_for_spots(destination, weather_data)
-        spots: List[dict] = []
+    def cache_key(destination: str, weather: dict) -> str:
+        band, umbrella = weather_bucket(weather)
+        return f"{MODEL_NAME}|{normalize_place(destination)}|{band}|{umbrella}"
+
+    @staticmethod
+    def cached_recommendations(destination: str, weather: dict) -> List[dict]:
+        if not model_available():
+            return []
+        cached = get_recommendation_cache().get(LocationAgent.cache_key(destination, weather))
+        if cached:
+            logger.info("LocationAgent: %d spots from recommendation cache", len(cached))
+        return cached or []
+
+    @staticmethod
+    def fetch_recommendations(destination: str, weather: dict) -> List[dict]:
+        """Ask the model and store a usable answer in the recommendation cache."""
+        spots = LocationAgent.call_gemini(LocationAgent.prompt_for_spots(destination, weather)) or []
+        if spots:
+            get_recommendation_cache().set(LocationAgent.cache_key(destination, weather), spots)
+        return spots
+
+    @staticmethod
+    def recommend(destination: str, weather: dict) -> List[dict]:
+        """Model recommendations for `destination`, served from the bucketed cache when possible.
+
+        Returns an empty list when no model is configured or it gave no usable answer.
+        """
+        if not model_available():
+            return []
+        return LocationAgent.cached_recommendations(destination, weather) or LocationAgent.fetch_recommendations(destination, weather)
+
+    @staticmethod
+    def hedged(destination: str, weather: dict, slo: float, fill_cache_late: bool = True) -> Tuple[List[dict], bool]:
+        """Race the model against the heuristic; returns `(spots, is_fallback)`.
+
+        The model call runs in the background while the heuristic is computed
+        up front. If the model answers within `slo` seconds its spots win;
+        otherwise the heuristic is returned and, with `fill_cache_late`, a late
+        model answer still lands in the recommendation cache for next time.
+        """
+        cached = LocationAgent.cached_recommendations(destination, weather)
+        if cached or not model_available():
+            return cached, False
+        if fill_cache_late:
+            future = _model_pool.submit(contextvars.copy_context().run, LocationAgent.fetch_recommendations, destination, weather)
+        else:
+            future = _model_pool.submit(contextvars.copy_context().run, LocationAgent.call_gemini,
+                                        LocationAgent.prompt_for_spots(destination, weather))
+        fallback = LocationAgent.heuristic(destination, weather)
         try:
-            spots = LocationAgent.call_gemini(prompt)
+            spots = future.result(timeout=slo)
             if spots:
+                return spots, False
+        except FutureTimeout:
+            logger.info("LocationAgent: model missed the %.2fs SLO, using heuristic", slo)
+        except Exception as e:
+            logger.debug("Gemini call failed or unavailable: %s", e)
+        return fallback, True
+
+    @staticmethod
+    def select(weather_data: dict, destination: str, slo: Optional[float] = None,
+               candidates: Optional[List[dict]] = None, top_n: Optional[int] = None) -> List[dict]:
+        """Recommend places for `destination` without touching the session store.
+
+        With `slo` (seconds) the model call is hedged against the heuristic.
+        Heuristic spots standing in for a configured model that was too slow
+        or failed are tagged `"fallback": True`. Extra `candidates` (e.g. from
+        a local catalog) are pooled with the model or heuristic spots and the
+        best `top_n` for the weather are returned (see `agents.ranking`).
+        """
+        # Try real model first if configured
+        spots: List[dict] = []
+        fallback = False
+        try:
+            if slo is not None:
+                spots, fallback = LocationAgent.hedged(destination, weather_data, slo)
+            else:
+                spots = LocationAgent.recommend(destination, weather_data)
+            if spots and not fallback:
                 logger.info("LocationAgent: obtained %d spots from Gemini", len(spots))
         except Exception as e:
             logger.debug("Gemini call failed or unavailable: %s", e)
@@ -107,13 +266,64 @@ class LocationAgent:
         if not spots:
             spots = LocationAgent.heuristic(destination, weather_data)
             logger.info("LocationAgent: using heuristic, returned %d spots", len(spots))
+            fallback = model_available()
+
+        if fallback:
+            for s in spots:
+                s["fallback"] = True
+        if candidates or top_n is not None:
+            from agents.ranking import top_places
 
-        # store state & memory
-        InMemorySessionService.set_state_value(session_id, "last_recommendations", spots)
-        InMemorySessionService.append_memory(session_id, {"when": weather_data.get("date"), "places": spots})
+            with span("ranking"):
+                pool = spots + [dict(c) for c in candidates or ()]
+                spots = top_places(pool, weather_data, len(spots) if top_n is None else top_n)
+        return spots
+
+    @staticmethod
+    def record(spots: List[dict], destination: str, date: Optional[str]) -> List[dict]:
+        """Store `spots` in a new session; returns copies tagged with its `session_id`."""
+        sessions = get_session_service()
+        session_id = sessions.create_session({"destination": destination, "date": date})
+        sessions.set_state_value(session_id, "last_recommendations", spots)
+        # the full list is already in state; memory only needs to remember which places
+        sessions.append_memory(session_id, {"when": date, "places": [s.get("name") for s in spots]})
 
-        # Attach session id for traceability
+        # Attach session id for traceability (copies: `spots` may be shared through a memo)
+        tagged = []
         for s in spots:
+            s = dict(s)
             s.setdefault("session_id", session_id)
+            tagged.append(s)
+        return tagged
 
-        return spots
+    @staticmethod
+    def run(weather_data: dict, destination: str, slo: Optional[float] = None,
+            candidates: Optional[List[dict]] = None, top_n: Optional[int] = None) -> List[dict]:
+        """Recommend places for `destination` (see `select`) and record them in session memory."""
+        spots = LocationAgent.select(weather_data, destination, slo=slo, candidates=candidates, top_n=top_n)
+        return LocationAgent.record(spots, destination, weather_data.get("date"))
+
+    @staticmethod
+    def select_days(weather_days: List[dict], destination: str, slo: Optional[float] = None,
+                    candidates: Optional[List[dict]] = None, top_n: Optional[int] = None) -> List[List[dict]]:
+        """Recommend places for each day of a stay; returns one list per entry of `weather_days`.
+
+        Days in the same weather bucket (temperature band and umbrella level)
+        share one recommendation, so a stay costs at most one model call per
+        distinct bucket rather than one per day.
+        """
+        by_bucket = {}
+        days = []
+        for weather in weather_days:
+            bucket = weather_bucket(weather)
+            if bucket not in by_bucket:
+                by_bucket[bucket] = LocationAgent.select(weather, destination, slo=slo, candidates=candidates, top_n=top_n)
+            days.append([dict(s) for s in by_bucket[bucket]])
+        return days
+
+    @staticmethod
+    def run_days(weather_days: List[dict], destination: str, slo: Optional[float] = None,
+                 candidates: Optional[List[dict]] = None, top_n: Optional[int] = None) -> List[List[dict]]:
+        """`select_days`, with each day's places recorded in session memory."""
+        days = LocationAgent.select_days(weather_days, destination, slo=slo, candidates=candidates, top_n=top_n)
+        return [LocationAgent.record(spots, destination, w.get("date")) for w, spots in zip(weather_days, days)]
@@ -0,0 +1,154 @@
+"""Lightweight tracing spans and counters for the planner.
+
+`span("geocode")` times a block. Every finished span feeds a process-wide
+histogram and, when a plan is being traced (`trace_plan()`), that plan's
+`timings` block. `incr(...)` bumps labelled counters such as cache hits or
+HTTP retries. `prometheus_text()` renders everything in the Prometheus text
+format, and `add_exporter(fn)` forwards each span/counter event to a custom
+sink (e.g. a StatsD or OpenTelemetry bridge).
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# histogram bucket upper bounds, seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, _Labels], float] = {}
+_histograms: Dict[str, List[float]] = {}  # span -> [count, sum, *bucket counts]
+_exporters: List[Callable[[dict], None]] = []
+
+
+class PlanTimings:
+    """Per-plan span totals, shared by every thread working on the plan."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.spans: Dict[str, List[float]] = {}
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            entry = self.spans.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            spans = {name: {"ms": round(total * 1000, 2), "calls": int(calls)} for name, (calls, total) in self.spans.items()}
+        return {"total_ms": round((time.perf_counter() - self._started) * 1000, 2), "spans": spans}
+
+
+_current: "contextvars.ContextVar[Optional[PlanTimings]]" = contextvars.ContextVar("plan_timings", default=None)
+
+
+@contextmanager
+def trace_plan() -> Iterator[PlanTimings]:
+    """Collect the spans of one plan; threads started with a copied context report here too."""
+    timings = PlanTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def _emit(event: dict):
+    for exporter in list(_exporters):
+        try:
+            exporter(event)
+        except Exception:
+            pass
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            hist = _histograms.get(name)
+            if hist is None:
+                hist = _histograms[name] = [0, 0.0] + [0] * len(BUCKETS)
+            hist[0] += 1
+            hist[1] += elapsed
+            for i, bound in enumerate(BUCKETS):
+                if elapsed <= bound:
+                    hist[2 + i] += 1
+        timings = _current.get()
+        if timings is not None:
+            timings.add(name, elapsed)
+        if _exporters:
+            _emit({"type": "span", "name": name, "seconds": elapsed, "error": error})
+
+
+def incr(name: str, value: float = 1, **labels: str):
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    if _exporters:
+        _emit({"type": "counter", "name": name, "value": value, "labels": labels})
+
+
+def add_exporter(fn: Callable[[dict], None]):
+    """Call `fn(event)` for every finished span and counter increment."""
+    _exporters.append(fn)
+
+
+def remove_exporter(fn: Callable[[dict], None]):
+    if fn in _exporters:
+        _exporters.remove(fn)
+
+
+def snapshot() -> dict:
+    with _lock:
+        counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in _counters.items()]
+        spans = {n: {"count": int(h[0]), "sum_s": round(h[1], 6)} for n, h in _histograms.items()}
+    return {"counters": counters, "spans": spans}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _fmt_labels(labels: _Labels) -> str:
+    if not labels:
+        return ""
+    inner = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+    return "{" + inner + "}"
+
+
+def prometheus_text() -> str:
+    """All counters and span histograms in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((n, list(h)) for n, h in _histograms.items())
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        lines.append(f"{name}{_fmt_labels(labels)} {value:g}")
+    if histograms:
+        lines.append("# TYPE planner_span_seconds histogram")
+    for name, hist in histograms:
+        for bound, count in zip(BUCKETS, hist[2:]):
+            lines.append(f'planner_span_seconds_bucket{{span="{name}",le="{bound:g}"}} {count}')
+        lines.append(f'planner_span_seconds_bucket{{span="{name}",le="+Inf"}} {hist[0]}')
+        lines.append(f'planner_span_seconds_sum{{span="{name}"}} {hist[1]:.6f}')
+        lines.append(f'planner_span_seconds_count{{span="{name}"}} {hist[0]}')
+    return "\n".join(lines) + "\n"
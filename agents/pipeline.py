@@ -0,0 +1,518 @@
+"""Planning pipeline shared by the CLI and other entry points.
+
+`plan_async` runs the agents as an asyncio dependency graph: every step starts
+as soon as its inputs are ready, blocking agent calls run in worker threads,
+and an optional overall `budget` (seconds) bounds the whole plan. Steps that
+miss the deadline are abandoned and replaced by a degraded result, and their
+names are listed under `"degraded"` in the output.
+"""
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Optional
+
+from agents.cache import SingleFlight, SqliteTTLCache, cache_path
+from agents.weather_agent import GEOCODE_CACHE_TTL, WeatherAgent, next_issue_time, normalize_place
+from agents.location_agent import RECOMMENDATION_CACHE_TTL, LocationAgent, model_available
+from agents.cost_agent import CostAgent
+from agents.itinerary import plan_itinerary
+from agents.metrics import incr, span, trace_plan
+from agents.ranking import evaluate_places
+from agents.session import get_session_service
+
+logger = logging.getLogger(__name__)
+
+# Blocking agent calls run here rather than on the loop's default executor, so
+# a plan that gave up on a slow branch does not wait for it at loop shutdown.
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="planner")
+
+# How long `StepMemo` keeps each step's result; forecast steps instead expire
+# when the next model run is issued. Bump STEP_VERSION when a step's output changes shape.
+STEP_VERSION = 1
+STEP_TTLS = {
+    "geocode": GEOCODE_CACHE_TTL,
+    "places": RECOMMENDATION_CACHE_TTL,
+    "places_days": RECOMMENDATION_CACHE_TTL,
+    "itinerary": RECOMMENDATION_CACHE_TTL,
+}
+FORECAST_STEPS = ("weather", "weather_range")
+STEP_CACHE_MAX_ENTRIES = 20000
+
+_step_cache = None
+_step_cache_lock = threading.Lock()
+
+
+def get_step_cache() -> SqliteTTLCache:
+    global _step_cache
+    if _step_cache is None:
+        with _step_cache_lock:
+            if _step_cache is None:
+                _step_cache = SqliteTTLCache(cache_path("steps.sqlite"), namespace="steps",
+                                             max_entries=STEP_CACHE_MAX_ENTRIES)
+    return _step_cache
+
+
+def _in_thread(fn, *args) -> "asyncio.Future":
+    """Schedule `fn(*args)` on the planner pool, carrying the caller's contextvars."""
+    ctx = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(_executor, functools.partial(ctx.run, fn, *args))
+
+
+def _settle(futures: Iterable["asyncio.Future"]):
+    """Cancel unfinished `futures` and retrieve the errors of finished ones."""
+    for fut in futures:
+        if not fut.done():
+            fut.cancel()
+        elif not fut.cancelled():
+            fut.exception()
+
+
+class PlanMemo:
+    """Results shared between the plans of one batch.
+
+    Plans that need the same geocode, forecast or place list compute it once;
+    concurrent plans asking for a key that is still in flight wait for it.
+    Failures are not remembered.
+    """
+
+    def __init__(self):
+        self._flight = SingleFlight()
+        self._results: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def call(self, kind: str, key, fn: Callable, *args):
+        k = kind + ":" + json.dumps(key, sort_keys=True, default=str)
+        with self._lock:
+            if k in self._results:
+                self.hits += 1
+                incr("planner_cache_requests_total", cache="memo", result="hit")
+                return self._results[k]
+        incr("planner_cache_requests_total", cache="memo", result="miss")
+
+        def compute():
+            value = fn(*args)
+            with self._lock:
+                self._results[k] = value
+            return value
+
+        return self._flight.do(k, compute)
+
+
+class StepMemo:
+    """Persistent memo for re-planning: step results are stored on disk under a hash of their inputs.
+
+    The plan is a graph of steps, each keyed by exactly the inputs it reads:
+
+        geocode(destination), geocode(origin)
+        weather(destination, date[, nights])        -> places(destination, weather) -> itinerary(places, coords)
+        transport(coords), hotel(nights, tier), tickets(places), evaluation(places, weather), total
+
+    Re-running a plan with only `nights`, `hotel_tier` or `origin` changed hits
+    the stored geocodes, forecast and places and recomputes just the cheap
+    cost steps. Heuristic fallbacks are not stored, so a slow model is asked
+    again next time.
+    """
+
+    def __init__(self, cache: Optional[SqliteTTLCache] = None):
+        self._cache = cache or get_step_cache()
+        self._flight = SingleFlight()
+        self.hits = 0
+
+    def call(self, kind: str, key, fn: Callable, *args):
+        digest = hashlib.sha256(json.dumps([STEP_VERSION, key], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        k = f"{kind}:{digest}"
+        stored = self._cache.get(k)
+        if stored is not None:
+            self.hits += 1
+            return stored
+
+        def compute():
+            value = fn(*args)
+            if not _is_fallback(value):
+                if kind in FORECAST_STEPS:
+                    self._cache.set(k, value, expires_at=next_issue_time())
+                else:
+                    self._cache.set(k, value, ttl=STEP_TTLS.get(kind))
+            return value
+
+        return self._flight.do(k, compute)
+
+
+# weather `"source"` values set by `WeatherAgent` when Open-Meteo could not answer
+FALLBACK_SOURCES = frozenset({"stale_forecast", "climatology"})
+
+
+def _is_fallback(value) -> bool:
+    if isinstance(value, dict):
+        return bool(value.get("fallback")) or value.get("source") in FALLBACK_SOURCES
+    if isinstance(value, list):
+        return any(_is_fallback(v) for v in value)
+    return False
+
+
+def _direct(kind: str, key, fn: Callable, *args):
+    return fn(*args)
+
+
+def _unknown_weather(destination: str, date: str, coords=None) -> dict:
+    lat, lon = coords if coords else (None, None)
+    return {
+        "destination": destination,
+        "date": date,
+        "lat": lat,
+        "lon": lon,
+        "temp_max": None,
+        "temp_min": None,
+        "precipitation_sum_mm": None,
+        "weathercode": None,
+        "umbrella_recommendation": "unknown",
+    }
+
+
+def _ranking_key(candidates: Optional[List[dict]], top_n: Optional[int]):
+    if not candidates and top_n is None:
+        return None
+    # the catalog can be large: key on a digest of what ranking reads
+    digest = hashlib.sha256(json.dumps([[c.get("name"), c.get("type")] for c in candidates or ()]).encode("utf-8"))
+    return [top_n, digest.hexdigest()]
+
+
+def _itinerary_key(places: List[dict], coords, destination: str) -> list:
+    return [normalize_place(destination), list(coords), [[p.get("name"), p.get("type"), p.get("best_time")] for p in places]]
+
+
+def _stay_dates(date: str, days: int) -> List[str]:
+    start = datetime.strptime(date, "%Y-%m-%d").date()
+    return [(start + timedelta(days=k)).isoformat() for k in range(days)]
+
+
+def _distinct_places(daily: List[List[dict]]) -> List[dict]:
+    """Every place recommended during the stay, once, in first-seen order."""
+    seen = set()
+    places = []
+    for spots in daily:
+        for spot in spots:
+            name = spot.get("name")
+            if name not in seen:
+                seen.add(name)
+                places.append(spot)
+    return places
+
+
+class _Deadline:
+    """Tracks the remaining budget and which steps had to be degraded."""
+
+    def __init__(self, budget: Optional[float]):
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self.expires = None if budget is None else loop.time() + budget
+        self.degraded: List[str] = []
+
+    def expired(self) -> bool:
+        return self.expires is not None and self._loop.time() >= self.expires
+
+    async def wait(self, name: str, task: "asyncio.Future", fallback, degrade_on_error: bool = False):
+        """Await `task` within the remaining budget, else cancel it and return `fallback()`.
+
+        With `degrade_on_error`, a step that fails is degraded the same way
+        instead of failing the plan.
+        """
+        timeout = None if self.expires is None else max(self.expires - self._loop.time(), 0)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            task.cancel()
+            logger.warning("Planner step %s missed the deadline; degrading", name)
+        except Exception as e:
+            if not degrade_on_error:
+                raise
+            logger.warning("Planner step %s failed (%s); degrading", name, e)
+        self.degraded.append(name)
+        return fallback()
+
+
+async def plan_async(destination: str, date: str, origin: Optional[str] = None, nights: int = 1,
+                     hotel_tier: str = "mid", budget: Optional[float] = None,
+                     memo=None, model_slo: Optional[float] = None,
+                     itinerary: bool = False, on_event: Optional[Callable[[dict], None]] = None,
+                     candidates: Optional[List[dict]] = None, top_n: Optional[int] = None) -> dict:
+    """Plan a trip, overlapping independent steps and honouring an optional latency budget.
+
+    Pass a shared `memo` (`PlanMemo` for a batch, `StepMemo` to persist steps
+    across runs) to de-duplicate upstream work across many plans,
+    `model_slo` to hedge the model call against the heuristic, and
+    `itinerary=True` to order the places into a priced day route.
+    `candidates` (e.g. a local catalog) are ranked together with the
+    recommended places and the best `top_n` kept. Stays of
+    more than one night add a `"daily_plan"` with weather and places per day;
+    `recommended_places` then lists every place of the stay once. Per-step
+    span durations are reported under `"timings"` (see `agents.metrics`).
+
+    `on_event(event)` is called on the loop as each stage completes, with
+    `{"event": "geocode" | "weather" | "places" | "itinerary" | "costs" |
+    "evaluation" | "summary", "elapsed_ms", ...}`; see `plan_stream`.
+    """
+    with trace_plan() as timings:
+        logger.info("Starting planner for %s on %s", destination, date)
+        deadline = _Deadline(budget)
+        call = memo.call if memo is not None else _direct
+        ranking_key = _ranking_key(candidates, top_n)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        def emit(event: str, **fields):
+            if on_event is not None:
+                on_event({"event": event, "elapsed_ms": round((loop.time() - started) * 1000, 1), **fields})
+
+        # Create a session for this planning run
+        session_id = get_session_service().create_session({"destination": destination, "date": date})
+
+        # every step started on the pool, settled however the plan ends
+        steps: List["asyncio.Future"] = []
+
+        def start(*args) -> "asyncio.Future":
+            task = _in_thread(*args)
+            steps.append(task)
+            return task
+
+        try:
+            # Start everything that only depends on the request itself.
+            dest_task = start(call, "geocode", normalize_place(destination), WeatherAgent.geocode_place, destination)
+            days = max(nights, 1)
+            if days > 1:
+                weather_task = start(call, "weather_range", [normalize_place(destination), date, days],
+                                     WeatherAgent.run_range, destination, date, days)
+            else:
+                weather_task = start(call, "weather", [normalize_place(destination), date], WeatherAgent.run, destination, date)
+            if origin:
+                origin_task = start(call, "geocode", normalize_place(origin), WeatherAgent.geocode_place, origin)
+            else:
+                origin_task = None
+            hotel = CostAgent.estimate_hotel(nights=nights, quality=hotel_tier)
+
+            dest_coords = await deadline.wait("geocode", dest_task, lambda: None)
+            emit("geocode", place=destination, role="destination", coords=dest_coords)
+
+            async def places_branch():
+                weather = await deadline.wait("weather", weather_task, lambda: _unknown_weather(destination, date, dest_coords))
+                if weather.get("destination") != destination:
+                    # shared via the memo under the normalized name
+                    weather = dict(weather, destination=destination)
+                logger.info("Weather fetched: lat=%s lon=%s", weather.get("lat"), weather.get("lon"))
+                emit("weather", weather=weather)
+                if deadline.expired():
+                    # no budget left for the model round trip
+                    deadline.degraded.append("places")
+                    places = LocationAgent.record(LocationAgent.heuristic(destination, weather), destination, date)
+                    emit("places", recommended_places=places)
+                    return weather, places, None
+                # the memo keeps only the recommendation; session writes happen per run below
+                places_key = [normalize_place(destination), date, weather.get("temp_max"), weather.get("umbrella_recommendation"),
+                              ranking_key, model_available()]
+                places_task = start(call, "places", places_key, LocationAgent.select, weather, destination, model_slo,
+                                    candidates, top_n)
+                places = await deadline.wait("places", places_task, lambda: LocationAgent.heuristic(destination, weather))
+                places = LocationAgent.record(places, destination, date)
+                emit("places", recommended_places=places)
+                route = None
+                if itinerary and dest_coords is not None:
+                    route_task = start(call, "itinerary", _itinerary_key(places, dest_coords, destination),
+                                       plan_itinerary, places, dest_coords, destination)
+                    route = await deadline.wait("itinerary", route_task, lambda: None)
+                return weather, places, route
+
+            async def stay_branch():
+                """Multi-day variant of `places_branch`: one range forecast, recommendations per weather bucket."""
+                dates = _stay_dates(date, days)
+                weather_days = await deadline.wait(
+                    "weather", weather_task, lambda: [_unknown_weather(destination, d, dest_coords) for d in dates])
+                weather_days = [w if w.get("destination") == destination else dict(w, destination=destination) for w in weather_days]
+                emit("weather", weather=weather_days[0], days=weather_days)
+                if deadline.expired():
+                    deadline.degraded.append("places")
+                    daily = [LocationAgent.heuristic(destination, w) for w in weather_days]
+                else:
+                    places_key = [normalize_place(destination), ranking_key, model_available()] + [
+                        [w.get("date"), w.get("temp_max"), w.get("umbrella_recommendation")] for w in weather_days]
+                    places_task = start(call, "places_days", places_key, LocationAgent.select_days, weather_days, destination,
+                                        model_slo, candidates, top_n)
+                    daily = await deadline.wait("places", places_task,
+                                                lambda: [LocationAgent.heuristic(destination, w) for w in weather_days])
+                daily = [LocationAgent.record(spots, destination, w.get("date")) for w, spots in zip(weather_days, daily)]
+                places = _distinct_places(daily)
+                emit("places", recommended_places=places, days=[{"date": w.get("date"), "recommended_places": spots}
+                                                                for w, spots in zip(weather_days, daily)])
+                route = None
+                if itinerary and dest_coords is not None:
+                    # the route covers the arrival day
+                    route_task = start(call, "itinerary", _itinerary_key(daily[0], dest_coords, destination),
+                                       plan_itinerary, daily[0], dest_coords, destination)
+                    route = await deadline.wait("itinerary", route_task, lambda: None)
+                daily_plan = [{"date": w.get("date"), "weather": w, "recommended_places": spots}
+                              for w, spots in zip(weather_days, daily)]
+                return weather_days[0], places, route, daily_plan
+
+            async def transport_branch():
+                if origin_task is None:
+                    origin_coords = dest_coords
+                else:
+                    # the origin only feeds the transport estimate: an unknown origin must not fail the plan
+                    origin_coords = await deadline.wait("origin_geocode", origin_task, lambda: dest_coords,
+                                                        degrade_on_error=True)
+                    emit("geocode", place=origin, role="origin", coords=origin_coords)
+                if dest_coords is None or origin_coords is None:
+                    return {"distance_km": None, "taxi_usd": 0, "bus_usd": 0, "suggested_mode": None}
+                return CostAgent.estimate_transport(origin_coords, dest_coords)
+
+            daily_plan = None
+            if days > 1:
+                (weather, places, route, daily_plan), transport = await asyncio.gather(stay_branch(), transport_branch())
+            else:
+                (weather, places, route), transport = await asyncio.gather(places_branch(), transport_branch())
+        finally:
+            # a failed step must not leave the others to log "exception was never retrieved"
+            _settle(steps)
+        if route is not None:
+            emit("itinerary", itinerary=route)
+
+        with span("cost"):
+            tickets = CostAgent.estimate_tickets(places)
+            cost = CostAgent.breakdown(transport, hotel, tickets, local_transport=route)
+        emit("costs", costs=cost)
+
+        with span("evaluation"):
+            eval_scores = evaluate_places(places, weather)
+            for day in daily_plan or ():
+                day["evaluation"] = evaluate_places(day["recommended_places"], day["weather"])
+        logger.info("Evaluation scores: %s", eval_scores)
+        emit("evaluation", evaluation=eval_scores)
+
+        final = {
+            "destination": destination,
+            "date": date,
+            "weather": weather,
+            "recommended_places": places,
+            "costs": cost,
+            "session_id": session_id,
+            "evaluation": eval_scores,
+        }
+        if daily_plan is not None:
+            final["daily_plan"] = daily_plan
+        if route is not None:
+            final["itinerary"] = route
+        if deadline.degraded:
+            final["degraded"] = deadline.degraded
+        final["timings"] = timings.as_dict()
+        emit("summary", plan=final)
+        return final
+
+
+def plan(destination: str, date: str, origin: Optional[str] = None, nights: int = 1,
+         hotel_tier: str = "mid", budget: Optional[float] = None, model_slo: Optional[float] = None,
+         itinerary: bool = False, memo=None, candidates: Optional[List[dict]] = None,
+         top_n: Optional[int] = None) -> dict:
+    """Blocking wrapper around `plan_async`; pass `memo=StepMemo()` to reuse steps across runs."""
+    return asyncio.run(plan_async(destination, date, origin=origin, nights=nights, hotel_tier=hotel_tier,
+                                  budget=budget, memo=memo, model_slo=model_slo, itinerary=itinerary,
+                                  candidates=candidates, top_n=top_n))
+
+
+def plan_stream(destination: str, date: str, origin: Optional[str] = None, nights: int = 1,
+                hotel_tier: str = "mid", budget: Optional[float] = None, model_slo: Optional[float] = None,
+                itinerary: bool = False, memo=None, candidates: Optional[List[dict]] = None,
+                top_n: Optional[int] = None) -> Iterator[dict]:
+    """Plan a trip, yielding each stage's event as soon as it completes.
+
+    The last event is `{"event": "summary", "plan": ...}` with the same plan
+    `plan()` returns; errors are raised from the generator. The plan runs on
+    its own thread, so the weather can be shown while the model is still
+    thinking.
+    """
+    events: "queue.Queue" = queue.Queue()
+    done = object()
+
+    def run():
+        try:
+            asyncio.run(plan_async(destination, date, origin=origin, nights=nights, hotel_tier=hotel_tier,
+                                   budget=budget, memo=memo, model_slo=model_slo, itinerary=itinerary,
+                                   on_event=events.put, candidates=candidates, top_n=top_n))
+        except BaseException as e:
+            events.put(e)
+        events.put(done)
+
+    threading.Thread(target=run, name="plan-stream", daemon=True).start()
+    while True:
+        event = events.get()
+        if event is done:
+            return
+        if isinstance(event, BaseException):
+            raise event
+        yield event
+
+
+async def plan_batch_async(lines: Iterable[str], out: IO[str], workers: int = 8,
+                           budget: Optional[float] = None, model_slo: Optional[float] = None) -> Dict[str, int]:
+    """Plan every JSONL request in `lines`, writing one JSON line per result as it completes.
+
+    Each input line holds `destination` and `date` plus optional `origin`,
+    `nights`, `hotel_tier`, `itinerary` and `id`. At most `workers` plans run at once and
+    input is read only as slots free up, so arbitrarily large files stream.
+    Output lines carry the input `line` number (and `id` if given) with either
+    `result` or `error`.
+    """
+    memo = PlanMemo()
+    slots = asyncio.Semaphore(workers)
+    counts = {"ok": 0, "error": 0}
+    pending = set()
+
+    async def one(lineno: int, raw: str):
+        record: Dict[str, Any] = {"line": lineno}
+        try:
+            req = json.loads(raw)
+            if "id" in req:
+                record["id"] = req["id"]
+            record["result"] = await plan_async(
+                req["destination"],
+                req["date"],
+                origin=req.get("origin"),
+                nights=int(req.get("nights", 1)),
+                hotel_tier=req.get("hotel_tier", "mid"),
+                budget=budget,
+                memo=memo,
+                model_slo=model_slo,
+                itinerary=bool(req.get("itinerary", False)),
+            )
+            counts["ok"] += 1
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            counts["error"] += 1
+        finally:
+            slots.release()
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    for lineno, raw in enumerate(lines, 1):
+        if not raw.strip():
+            continue
+        await slots.acquire()
+        task = asyncio.ensure_future(one(lineno, raw))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.gather(*pending)
+    counts["memo_hits"] = memo.hits
+    return counts
+
+
+def plan_batch(lines: Iterable[str], out: IO[str], workers: int = 8, budget: Optional[float] = None,
+               model_slo: Optional[float] = None) -> Dict[str, int]:
+    """Blocking wrapper around `plan_batch_async`."""
+    return asyncio.run(plan_batch_async(lines, out, workers=workers, budget=budget, model_slo=model_slo))
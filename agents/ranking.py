@@ -0,0 +1,149 @@
+"""Place ranking
+
+Scores candidate places against the weather with a rule table compiled once
+into a (weather row x place type) score matrix: scoring a candidate set is a
+single gather over its encoded type ids, and the best `k` are picked without
+sorting the whole set. Candidates can come from the model, the heuristic or
+a local catalog; encode a catalog once with `Ranker.encode` and reuse it.
+"""
+import heapq
+import importlib.util
+from array import array
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from agents.location_agent import TEMP_BAND_EDGES, TEMP_BAND_LABELS, temperature_band
+
+# optional: vectorized scoring over large candidate sets; numpy is imported on
+# first use, and only for sets big enough to repay it
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+NUMPY_MIN_CANDIDATES = 256
+
+BASE_SCORE = 50
+DEFAULT_TYPE = "tour"
+# temperature assumed when the forecast has none
+DEFAULT_TEMP = 25
+UMBRELLA_LEVELS = ("low", "possible", "high", "unknown")
+
+# (umbrella levels or None for any, place types or None for any, minimum temp_max or None, bonus)
+# Temperature thresholds must be band edges (see TEMP_BAND_EDGES).
+RULES: Tuple[tuple, ...] = (
+    (("high",), ("museum", "mall", "market", "brewery"), None, 30),
+    (("low",), ("beach", "park", "garden"), None, 20),
+    (None, ("beach",), 28, 10),
+)
+
+# lower temperature bound of each band
+_BAND_FLOORS = (float("-inf"),) + tuple(TEMP_BAND_EDGES)
+
+
+class Ranker:
+    def __init__(self, rules: Sequence[tuple] = RULES, base: int = BASE_SCORE):
+        types = []
+        for _, rule_types, min_temp, _ in rules:
+            if min_temp is not None and min_temp not in TEMP_BAND_EDGES:
+                raise ValueError(f"temperature threshold {min_temp} is not a band edge {TEMP_BAND_EDGES}")
+            for t in rule_types or ():
+                if t not in types:
+                    types.append(t)
+        # the last column scores every type no rule names
+        self.types = {t: i for i, t in enumerate(types)}
+        self._other = len(types)
+        self._rows = {}
+        table = []
+        for umbrella in UMBRELLA_LEVELS:
+            for band, floor in zip(TEMP_BAND_LABELS, _BAND_FLOORS):
+                row = [base] * (len(types) + 1)
+                for levels, rule_types, min_temp, bonus in rules:
+                    if levels is not None and umbrella not in levels:
+                        continue
+                    if min_temp is not None and floor < min_temp:
+                        continue
+                    cols = range(len(row)) if rule_types is None else [self.types[t] for t in rule_types]
+                    for c in cols:
+                        row[c] += bonus
+                self._rows[(umbrella, band)] = len(table)
+                table.append(row)
+        self.table = [array("i", row) for row in table]
+        self._matrix = None
+
+    def _vectorized(self, n: int) -> bool:
+        return NUMPY_AVAILABLE and n >= NUMPY_MIN_CANDIDATES
+
+    def matrix(self):
+        """The score table as a NumPy int32 matrix (built on first use)."""
+        if self._matrix is None:
+            import numpy as np
+
+            self._matrix = np.array(self.table, dtype=np.int32)
+        return self._matrix
+
+    def row(self, weather: dict) -> int:
+        temp = weather.get("temp_max")
+        band = temperature_band(DEFAULT_TEMP if temp is None else temp)
+        umbrella = weather.get("umbrella_recommendation")
+        return self._rows[(umbrella if umbrella in UMBRELLA_LEVELS else "unknown", band)]
+
+    def encode(self, candidates: Iterable[dict]):
+        """Column index of each candidate's type, as an int16 array."""
+        types, other = self.types, self._other
+        return array("h", (types.get(c.get("type", DEFAULT_TYPE), other) for c in candidates))
+
+    def score(self, candidates: Sequence[dict], weather: dict, encoded=None):
+        """Score of every candidate, aligned with `candidates` (a NumPy array for large sets)."""
+        ids = self.encode(candidates) if encoded is None else encoded
+        if self._vectorized(len(ids)):
+            import numpy as np
+
+            return self.matrix()[self.row(weather)][np.frombuffer(ids, dtype=np.int16)]
+        row = self.table[self.row(weather)]
+        return [row[i] for i in ids]
+
+    def top_k(self, candidates: Sequence[dict], weather: dict, k: int, encoded=None) -> List[Tuple[dict, int]]:
+        """The `k` best `(candidate, score)` pairs, best first; ties keep input order."""
+        scores = self.score(candidates, weather, encoded)
+        n = len(candidates)
+        k = min(k, n)
+        if k <= 0:
+            return []
+        if self._vectorized(n):
+            import numpy as np
+
+            if k < n:
+                idx = np.argpartition(-scores, k - 1)[:k]
+                # argpartition does not keep ties stable: widen to every index tied with the k-th score
+                kth = scores[idx].min()
+                idx = np.concatenate([np.flatnonzero(scores > kth), np.flatnonzero(scores == kth)])
+            else:
+                idx = np.arange(n)
+            order = idx[np.lexsort((idx, -scores[idx]))][:k]
+            return [(candidates[i], int(scores[i])) for i in order]
+        best = heapq.nlargest(k, range(n), key=lambda i: (scores[i], -i))
+        return [(candidates[i], scores[i]) for i in best]
+
+
+_ranker: Optional[Ranker] = None
+
+
+def get_ranker() -> Ranker:
+    global _ranker
+    if _ranker is None:
+        _ranker = Ranker()
+    return _ranker
+
+
+def top_places(candidates: Sequence[dict], weather: dict, k: int) -> List[dict]:
+    """The `k` best candidates for `weather`, best first, de-duplicated by name."""
+    seen = set()
+    unique = []
+    for c in candidates:
+        name = c.get("name")
+        if name not in seen:
+            seen.add(name)
+            unique.append(c)
+    return [c for c, _ in get_ranker().top_k(unique, weather, k)]
+
+
+def evaluate_places(places_list: Sequence[dict], weather_info: dict) -> List[dict]:
+    """Score each place for the weather: `[{"name", "score"}]` in input order."""
+    scores = get_ranker().score(places_list, weather_info)
+    return [{"name": p.get("name"), "score": int(s)} for p, s in zip(places_list, scores)]
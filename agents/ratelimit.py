@@ -0,0 +1,119 @@
+"""Token-bucket rate limiting shared across threads and processes.
+
+`TokenBucket` keeps its state (available tokens, last refill time) in a small
+file guarded by an OS file lock, so every worker process on the machine draws
+from the same budget. A caller that finds the bucket empty reserves the next
+token and sleeps outside the lock, which keeps waiters in arrival order and
+spaces requests at exactly the configured rate.
+"""
+import os
+import struct
+import threading
+import time
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+_STATE = struct.Struct("dd")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = 1.0, path: Optional[str] = None):
+        """`rate` tokens per second, at most `burst` banked; `path` shares state between processes."""
+        self.rate = rate
+        self.burst = burst
+        self.path = None if path in (None, ":memory:") else path
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._stamp = time.time()
+        self._fd = None
+        self.acquired = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.waiting = 0
+
+    def _open(self) -> int:
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+
+    def _lock_file(self, fd: int):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_LOCK, _STATE.size)
+
+    def _unlock_file(self, fd: int):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        elif msvcrt is not None:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, _STATE.size)
+
+    def _update(self, delta: float) -> float:
+        """Refill, add `delta` tokens and return the resulting token count."""
+        with self._lock:
+            fd = self._open() if self.path else None
+            if fd is not None:
+                self._lock_file(fd)
+            try:
+                now = time.time()
+                if fd is not None:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    raw = os.read(fd, _STATE.size)
+                    if len(raw) == _STATE.size:
+                        self._tokens, self._stamp = _STATE.unpack(raw)
+                    else:
+                        self._tokens, self._stamp = self.burst, now
+                elapsed = max(now - self._stamp, 0.0)
+                tokens = min(self.burst, min(self.burst, self._tokens + elapsed * self.rate) + delta)
+                self._tokens, self._stamp = tokens, now
+                if fd is not None:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    os.write(fd, _STATE.pack(tokens, now))
+                return tokens
+            finally:
+                if fd is not None:
+                    self._unlock_file(fd)
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until it is due; returns the seconds waited."""
+        tokens = self._update(-1.0)
+        wait = -tokens / self.rate if tokens < 0 else 0.0
+        with self._lock:
+            self.acquired += 1
+            if wait > 0:
+                self.waited += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.waiting += 1
+        if wait > 0:
+            time.sleep(wait)
+            with self._lock:
+                self.waiting -= 1
+        return wait
+
+    def refund(self):
+        """Give back a token that was acquired but not used (e.g. the answer was already cached)."""
+        self._update(1.0)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "rate_per_s": self.rate,
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "waiting": self.waiting,
+                "total_wait_s": round(self.total_wait, 3),
+                "max_wait_s": round(self.max_wait, 3),
+                "mean_wait_s": round(self.total_wait / self.acquired, 3) if self.acquired else 0.0,
+            }
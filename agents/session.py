@@ -2,35 +2,416 @@
 
 This provides a tiny `InMemorySessionService` used by agents to persist
 short-lived session state and a basic long-term memory list per session.
+
+Sessions live in lock-protected shards so concurrent writers do not contend
+on one lock. Each shard keeps its sessions in LRU order and evicts those idle
+for longer than `SESSION_TTL` or beyond its share of `MAX_SESSIONS`, and a
+session's memory keeps only its last `MAX_MEMORY_ITEMS` entries, so a
+long-running process does not grow without bound.
+
+`SqliteSessionService` is a durable drop-in backend; `get_session_service()`
+returns whichever backend is configured.
 """
-from typing import Dict, Any
+from collections import OrderedDict, deque
+from typing import Dict, Any, List
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
 import uuid
 
+logger = logging.getLogger(__name__)
+
+SHARDS = 16
+SESSION_TTL = 3600.0
+MAX_SESSIONS = 10000
+MAX_MEMORY_ITEMS = 20
+
+
+class _SessionRecord:
+    __slots__ = ("state", "memory", "touched")
+
+    def __init__(self, max_memory: int):
+        self.state: Dict[str, Any] = {}
+        self.memory = deque(maxlen=max_memory)
+        self.touched = time.monotonic()
+
+
+class _Shard:
+    __slots__ = ("lock", "sessions", "evicted")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions: "OrderedDict[str, _SessionRecord]" = OrderedDict()
+        self.evicted = 0
+
+
 class InMemorySessionService:
-    _sessions: Dict[str, Dict[str, Any]] = {}
+    ttl = SESSION_TTL
+    max_sessions = MAX_SESSIONS
+    max_memory = MAX_MEMORY_ITEMS
+    _shards = [_Shard() for _ in range(SHARDS)]
+
+    @classmethod
+    def configure(cls, ttl: float = None, max_sessions: int = None, max_memory: int = None):
+        """Adjust limits; applies to sessions created (memory cap) or touched from now on."""
+        if ttl is not None:
+            cls.ttl = ttl
+        if max_sessions is not None:
+            cls.max_sessions = max_sessions
+        if max_memory is not None:
+            cls.max_memory = max_memory
+
+    @classmethod
+    def _shard(cls, session_id: str) -> _Shard:
+        return cls._shards[hash(session_id) % len(cls._shards)]
+
+    @classmethod
+    def _evict(cls, shard: _Shard, now: float):
+        # caller holds shard.lock; sessions are ordered least recently touched first
+        cap = max(1, cls.max_sessions // len(cls._shards))
+        sessions = shard.sessions
+        while sessions:
+            sid, rec = next(iter(sessions.items()))
+            if len(sessions) <= cap and now - rec.touched <= cls.ttl:
+                break
+            del sessions[sid]
+            shard.evicted += 1
+
+    @classmethod
+    def _record(cls, session_id: str, create: bool):
+        """Return the live record for `session_id` (creating it if asked), marking it used."""
+        shard = cls._shard(session_id)
+        now = time.monotonic()
+        with shard.lock:
+            rec = shard.sessions.get(session_id)
+            if rec is not None and now - rec.touched > cls.ttl:
+                del shard.sessions[session_id]
+                shard.evicted += 1
+                rec = None
+            if rec is None:
+                if not create:
+                    return None
+                rec = shard.sessions[session_id] = _SessionRecord(cls.max_memory)
+                cls._evict(shard, now)
+            else:
+                shard.sessions.move_to_end(session_id)
+            rec.touched = now
+            return rec
 
     @classmethod
     def create_session(cls, initial: Dict[str, Any] = None) -> str:
         sid = str(uuid.uuid4())
-        cls._sessions[sid] = {"state": {}, "memory": []}
+        rec = cls._record(sid, create=True)
         if initial:
-            cls._sessions[sid]["state"].update(initial)
+            rec.state.update(initial)
         return sid
 
     @classmethod
     def get_state(cls, session_id: str) -> Dict[str, Any]:
-        return cls._sessions.get(session_id, {}).get("state", {})
+        rec = cls._record(session_id, create=False)
+        return rec.state if rec is not None else {}
 
     @classmethod
     def set_state_value(cls, session_id: str, key: str, value: Any):
-        cls._sessions.setdefault(session_id, {"state": {}, "memory": []})
-        cls._sessions[session_id]["state"][key] = value
+        rec = cls._record(session_id, create=True)
+        rec.state[key] = value
 
     @classmethod
     def append_memory(cls, session_id: str, item: Any):
-        cls._sessions.setdefault(session_id, {"state": {}, "memory": []})
-        cls._sessions[session_id]["memory"].append(item)
+        rec = cls._record(session_id, create=True)
+        rec.memory.append(item)
+
+    @classmethod
+    def get_memory(cls, session_id: str) -> List[Any]:
+        rec = cls._record(session_id, create=False)
+        return list(rec.memory) if rec is not None else []
 
     @classmethod
-    def get_memory(cls, session_id: str):
-        return cls._sessions.get(session_id, {}).get("memory", [])
+    def clear(cls):
+        for shard in cls._shards:
+            with shard.lock:
+                shard.sessions.clear()
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """Session counts and a shallow estimate of the memory they hold."""
+        sessions = memory_items = approx_bytes = evicted = 0
+        for shard in cls._shards:
+            with shard.lock:
+                sessions += len(shard.sessions)
+                evicted += shard.evicted
+                approx_bytes += sys.getsizeof(shard.sessions)
+                for rec in shard.sessions.values():
+                    memory_items += len(rec.memory)
+                    approx_bytes += sys.getsizeof(rec) + sys.getsizeof(rec.state) + sys.getsizeof(rec.memory)
+                    approx_bytes += sum(sys.getsizeof(v) for v in rec.state.values())
+                    approx_bytes += sum(sys.getsizeof(v) for v in rec.memory)
+        return {
+            "backend": "memory",
+            "sessions": sessions,
+            "memory_items": memory_items,
+            "approx_bytes": approx_bytes,
+            "evicted": evicted,
+            "max_sessions": cls.max_sessions,
+            "ttl_s": cls.ttl,
+        }
+
+
+class SqliteSessionService:
+    """Durable session backend with the same API as `InMemorySessionService`.
+
+    Sessions live in one SQLite database in WAL mode, so they survive restarts
+    and several worker processes can read them while one writes. Writes are
+    queued and committed by a background thread in group commits of up to
+    `max_batch` operations (or every `flush_interval` seconds), so callers
+    never wait on fsync; a batch that cannot get the write lock is retried
+    `write_retries` times and then dropped (and logged). Memory is an
+    append-only log; every `compact_every` appends the writer trims each
+    session to its newest `max_memory` items and drops sessions idle for
+    longer than `ttl`. Reads flush pending writes first, so a process always
+    sees its own writes.
+    """
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_memory: int = MAX_MEMORY_ITEMS,
+                 flush_interval: float = 0.05, max_batch: int = 256, compact_every: int = 1000,
+                 write_retries: int = 3):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.compact_every = compact_every
+        self.write_retries = write_retries
+        self._queue: "queue.Queue" = queue.Queue()
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self._reader.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, updated REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS session_state ("
+            " session_id TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (session_id, key));"
+            "CREATE TABLE IF NOT EXISTS memory_log ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, item TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS memory_log_session ON memory_log(session_id, seq);"
+            "CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated);"
+        )
+        self.commits = 0
+        self.writes = 0
+        self.compactions = 0
+        self._since_compact = 0
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="session-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # -- writes ---------------------------------------------------------------
+
+    def create_session(self, initial: Dict[str, Any] = None) -> str:
+        sid = str(uuid.uuid4())
+        self._queue.put(("touch", sid, None, None))
+        for key, value in (initial or {}).items():
+            self._queue.put(("state", sid, key, json.dumps(value, ensure_ascii=False)))
+        return sid
+
+    def set_state_value(self, session_id: str, key: str, value: Any):
+        self._queue.put(("state", session_id, key, json.dumps(value, ensure_ascii=False)))
+
+    def append_memory(self, session_id: str, item: Any):
+        self._queue.put(("memory", session_id, None, json.dumps(item, ensure_ascii=False)))
+
+    def flush(self):
+        """Block until every write queued so far is committed."""
+        if self._closed:
+            return
+        self._wait("flush")
+
+    def compact(self):
+        """Trim memory logs and drop expired sessions now."""
+        if self._closed:
+            return
+        self._wait("compact")
+
+    def _wait(self, kind: str):
+        if not self._writer.is_alive():
+            raise RuntimeError("session writer is not running")
+        done = threading.Event()
+        self._queue.put((kind, None, None, done))
+        while not done.wait(0.5):
+            if not self._writer.is_alive():
+                raise RuntimeError("session writer stopped before the %s completed" % kind)
+
+    def close(self):
+        if not self._closed:
+            if self._writer.is_alive():
+                self.flush()
+            self._closed = True
+            self._queue.put(None)
+            self._writer.join()
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            self._drain(conn)
+        finally:
+            conn.close()
+            # release anyone still waiting on a flush the writer will never reach
+            while True:
+                try:
+                    op = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if op is not None and op[0] in ("flush", "compact"):
+                    op[3].set()
+
+    def _drain(self, conn: sqlite3.Connection):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                break
+            batch = [op]
+            deadline = time.monotonic() + self.flush_interval
+            # a flush/compact with nothing before it is applied straight away
+            while op[0] not in ("flush", "compact") and len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    nxt = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self._queue.put(None)
+                    break
+                batch.append(nxt)
+                if nxt[0] in ("flush", "compact"):
+                    break
+            self._apply(conn, batch)
+
+    def _apply(self, conn: sqlite3.Connection, batch: list):
+        waiters = [value for kind, _, _, value in batch if kind in ("flush", "compact")]
+        try:
+            for attempt in range(self.write_retries + 1):
+                try:
+                    self._commit(conn, batch)
+                    return
+                except sqlite3.OperationalError:
+                    # typically another process holding the write lock past the busy timeout
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    if attempt == self.write_retries:
+                        raise
+                    logger.warning("Session batch of %d writes failed, retrying", len(batch), exc_info=True)
+                    time.sleep(self.flush_interval * 2 ** attempt)
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.exception("Session batch of %d writes dropped", len(batch))
+        finally:
+            for done in waiters:
+                done.set()
+
+    def _commit(self, conn: sqlite3.Connection, batch: list):
+        writes = [op for op in batch if op[0] not in ("flush", "compact")]
+        compact = any(op[0] == "compact" for op in batch)
+        if not writes and not compact:
+            return
+        now = time.time()
+        since_compact = self._since_compact
+        conn.execute("BEGIN IMMEDIATE")
+        for kind, sid, key, value in writes:
+            conn.execute(
+                "INSERT INTO sessions (id, updated) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET updated = excluded.updated",
+                (sid, now),
+            )
+            if kind == "state":
+                conn.execute("INSERT OR REPLACE INTO session_state (session_id, key, value) VALUES (?, ?, ?)", (sid, key, value))
+            elif kind == "memory":
+                conn.execute("INSERT INTO memory_log (session_id, item) VALUES (?, ?)", (sid, value))
+                since_compact += 1
+        if compact or since_compact >= self.compact_every:
+            self._compact(conn, now)
+            since_compact = 0
+        conn.execute("COMMIT")
+        self._since_compact = since_compact
+        self.writes += len(writes)
+        self.commits += 1
+
+    def _compact(self, conn: sqlite3.Connection, now: float):
+        expired = "SELECT id FROM sessions WHERE updated < ?"
+        conn.execute(f"DELETE FROM memory_log WHERE session_id IN ({expired})", (now - self.ttl,))
+        conn.execute(f"DELETE FROM session_state WHERE session_id IN ({expired})", (now - self.ttl,))
+        conn.execute("DELETE FROM sessions WHERE updated < ?", (now - self.ttl,))
+        conn.execute(
+            "DELETE FROM memory_log WHERE seq IN (SELECT seq FROM ("
+            " SELECT seq, ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY seq DESC) AS rn FROM memory_log"
+            ") WHERE rn > ?)",
+            (self.max_memory,),
+        )
+        self.compactions += 1
+
+    # -- reads ----------------------------------------------------------------
+
+    def get_state(self, session_id: str) -> Dict[str, Any]:
+        """Return a copy of the session state (mutate it through `set_state_value`)."""
+        self.flush()
+        with self._read_lock:
+            rows = self._reader.execute("SELECT key, value FROM session_state WHERE session_id = ?", (session_id,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def get_memory(self, session_id: str) -> List[Any]:
+        self.flush()
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT item FROM (SELECT seq, item FROM memory_log WHERE session_id = ? ORDER BY seq DESC LIMIT ?) ORDER BY seq",
+                (session_id, self.max_memory),
+            ).fetchall()
+        return [json.loads(item) for (item,) in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._read_lock:
+            sessions = self._reader.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            memory_items = self._reader.execute("SELECT COUNT(*) FROM memory_log").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "sessions": sessions,
+            "memory_items": memory_items,
+            "pending_writes": self._queue.qsize(),
+            "writes": self.writes,
+            "commits": self.commits,
+            "compactions": self.compactions,
+        }
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def set_session_backend(backend):
+    """Use `backend` (e.g. a `SqliteSessionService`) for every agent session from now on."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def get_session_service():
+    """The configured session backend.
+
+    Defaults to `InMemorySessionService`; set `SESSION_DB` to a file path to
+    use a durable `SqliteSessionService` instead.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = os.environ.get("SESSION_DB")
+                _backend = SqliteSessionService(path) if path else InMemorySessionService
+    return _backend
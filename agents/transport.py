@@ -0,0 +1,205 @@
+"""Shared HTTP transport for the agents.
+
+One pooled `requests.Session` per process with keep-alive, a per-host cap on
+concurrent connections and retry with jittered exponential backoff on
+429/5xx and connection errors (read timeouts are not retried: the upstream
+already had the full timeout to answer). Open-Meteo's "out of allowed range"
+answer is handled here too: the request is retried once with the dates
+clamped to the allowed range.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from agents.metrics import incr
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "ai-agent/1.0"
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Nominatim's policy allows a single connection per client.
+DEFAULT_HOST_LIMITS = {"nominatim.openstreetmap.org": 1}
+
+
+class HttpError(RuntimeError):
+    """An error status from an upstream; `status` is the HTTP status code."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+_OUT_OF_RANGE = re.compile(r"from (\d{4}-\d{2}-\d{2}) to (\d{4}-\d{2}-\d{2})")
+
+
+class HttpTransport:
+    def __init__(
+        self,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        timeout: float = 10.0,
+        pool_maxsize: int = 16,
+        per_host_limit: int = 8,
+        host_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.per_host_limit = per_host_limit
+        self.host_limits = dict(DEFAULT_HOST_LIMITS if host_limits is None else host_limits)
+        self.retries = 0
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.host_limits.get(host, self.per_host_limit))
+            return slot
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # "full jitter": uniform in [0, base * 2**attempt], capped
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method: str, url: str, params: Optional[dict] = None, json: Any = None,
+                headers: Optional[dict] = None, timeout: Optional[float] = None,
+                before_retry: Optional[Callable[[], Any]] = None) -> requests.Response:
+        """Send a request, retrying 429/5xx and connection errors with jittered backoff.
+
+        The last response is returned even if its status is an error, so callers
+        can inspect the body; connection errors propagate after the final retry
+        and read timeouts at once. `before_retry()` runs before every retry
+        (e.g. to take another rate-limit token).
+        """
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            try:
+                with self._slot(host):
+                    resp = self.session.request(method, url, params=params, json=json, headers=headers,
+                                                timeout=timeout or self.timeout)
+            except requests.ConnectionError as e:
+                # includes ConnectTimeout; a ReadTimeout propagates without a retry
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                reason = type(e).__name__
+                logger.debug("%s %s failed (%s); retrying in %.2fs", method, host, e, delay)
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return resp
+                delay = self._backoff(attempt, resp.headers.get("Retry-After"))
+                reason = str(resp.status_code)
+                logger.debug("%s %s returned %s; retrying in %.2fs", method, host, resp.status_code, delay)
+            attempt += 1
+            self.retries += 1
+            incr("planner_http_retries_total", host=host, reason=reason)
+            time.sleep(delay)
+            if before_retry is not None:
+                before_retry()
+
+    def get(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None, timeout: Optional[float] = None,
+            before_retry: Optional[Callable[[], Any]] = None) -> requests.Response:
+        return self.request("GET", url, params=params, headers=headers, timeout=timeout, before_retry=before_retry)
+
+    def get_json(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+                 timeout: Optional[float] = None, clamp_dates: bool = False,
+                 before_retry: Optional[Callable[[], Any]] = None):
+        """GET `url` and decode JSON, raising `HttpError` on an error status.
+
+        With `clamp_dates`, an Open-Meteo "out of allowed range" error is retried
+        once with `start_date`/`end_date` clamped to the allowed range; a request
+        entirely past the range gets the last allowed day.
+        """
+        params = dict(params or {})
+        clamped = False
+        while True:
+            resp = self.get(url, params=params, headers=headers, timeout=timeout, before_retry=before_retry)
+            try:
+                resp.raise_for_status()
+                return resp.json()
+            except requests.HTTPError as e:
+                if clamp_dates and not clamped:
+                    allowed = self._allowed_range(resp)
+                    if allowed:
+                        params["start_date"], params["end_date"] = _clamp_range(
+                            params.get("start_date"), params.get("end_date"), *allowed)
+                        clamped = True
+                        continue
+                host = urlsplit(url).netloc
+                raise HttpError(f"{host} request failed: {e}\nResponse body: {resp.text}", resp.status_code)
+
+    def post_json(self, url: str, payload: Any, headers: Optional[dict] = None, timeout: Optional[float] = None):
+        """POST `payload` as JSON and decode the JSON answer, raising `HttpError` on an error status."""
+        resp = self.request("POST", url, json=payload, headers=headers, timeout=timeout)
+        try:
+            resp.raise_for_status()
+            return resp.json()
+        except requests.HTTPError as e:
+            host = urlsplit(url).netloc
+            raise HttpError(f"{host} request failed: {e}\nResponse body: {resp.text}", resp.status_code)
+
+    @staticmethod
+    def _allowed_range(resp: requests.Response) -> Optional[Tuple[str, str]]:
+        # try to parse JSON error to detect allowed range
+        try:
+            err = resp.json()
+            reason = err.get("reason", "") if isinstance(err, dict) else ""
+        except Exception:
+            reason = resp.text
+        if isinstance(reason, str) and "out of allowed range" in reason:
+            m = _OUT_OF_RANGE.search(reason)
+            if m:
+                return m.group(1), m.group(2)
+        return None
+
+
+def _clamp_range(start: Optional[str], end: Optional[str], allowed_start: str, allowed_end: str) -> Tuple[str, str]:
+    # ISO dates compare correctly as strings
+    start = max(start or allowed_start, allowed_start)
+    end = min(end or allowed_end, allowed_end)
+    if start > end:
+        return allowed_end, allowed_end
+    return start, end
+
+
+_transport: Optional[HttpTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HttpTransport:
+    """Return the process-wide transport, creating it on first use."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = HttpTransport()
+    return _transport
+
+
+def configure_transport(**kwargs) -> HttpTransport:
+    """Replace the process-wide transport with one built from `kwargs`."""
+    global _transport
+    with _transport_lock:
+        _transport = HttpTransport(**kwargs)
+    return _transport
@@ -2,85 +2,308 @@
 
 Queries Open-Meteo (free) for simplified weather information.
 """
-import requests
-from datetime import datetime
+import logging
+import math
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Union
+
+from agents.breaker import CircuitOpen, get_breaker
+from agents.cache import SingleFlight, SqliteTTLCache, cache_path, normalize_place
+from agents.metrics import incr, span
+from agents.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
 
 NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
 OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
 
+DAILY_FIELDS = "temperature_2m_max,temperature_2m_min,precipitation_sum,weathercode"
+# Open-Meteo accepts comma-separated coordinate lists; keep URLs a sane length.
+FORECAST_BATCH_SIZE = 50
+
+# Coordinates of a named place practically never change; keep them for a month.
+GEOCODE_CACHE_TTL = 30 * 24 * 3600
+GEOCODE_CACHE_MAX_ENTRIES = 50000
+# ...and keep expired ones another year as a fallback while Nominatim is unavailable
+GEOCODE_STALE_TTL = 365 * 24 * 3600
+
+# Nominatim's usage policy: at most one request per second, per machine.
+NOMINATIM_RATE_PER_S = 1.0
+
+# Forecast windows are cached per model grid cell (~0.1 deg for the
+# best-match models) and reused for every date inside the window until the
+# next model run is issued.
+FORECAST_GRID_DEG = 0.1
+FORECAST_WINDOW_DAYS = 16
+FORECAST_ISSUE_HOURS = 6
+FORECAST_CACHE_MAX_ENTRIES = 20000
+# superseded windows stay readable this long as a fallback while Open-Meteo is unavailable
+FORECAST_STALE_TTL = 3 * 24 * 3600
+
+_geocode_cache = None
+_forecast_cache = None
+_nominatim_bucket = None
+_cache_lock = threading.Lock()
+_geocode_flight = SingleFlight()
+_forecast_flight = SingleFlight()
+
+
+def get_geocode_cache() -> SqliteTTLCache:
+    global _geocode_cache
+    if _geocode_cache is None:
+        with _cache_lock:
+            if _geocode_cache is None:
+                _geocode_cache = SqliteTTLCache(
+                    cache_path("geocode.sqlite"),
+                    namespace="geocode",
+                    ttl=GEOCODE_CACHE_TTL,
+                    max_entries=GEOCODE_CACHE_MAX_ENTRIES,
+                    stale_ttl=GEOCODE_STALE_TTL,
+                )
+    return _geocode_cache
+
+
+def get_nominatim_limiter() -> TokenBucket:
+    """Token bucket shared by every thread and worker process using the same cache dir."""
+    global _nominatim_bucket
+    if _nominatim_bucket is None:
+        with _cache_lock:
+            if _nominatim_bucket is None:
+                _nominatim_bucket = TokenBucket(NOMINATIM_RATE_PER_S, burst=1.0, path=cache_path("nominatim.bucket"))
+    return _nominatim_bucket
+
+
+def get_forecast_cache() -> SqliteTTLCache:
+    global _forecast_cache
+    if _forecast_cache is None:
+        with _cache_lock:
+            if _forecast_cache is None:
+                _forecast_cache = SqliteTTLCache(
+                    cache_path("forecast.sqlite"),
+                    namespace="forecast",
+                    ttl=FORECAST_ISSUE_HOURS * 3600,
+                    max_entries=FORECAST_CACHE_MAX_ENTRIES,
+                    stale_ttl=FORECAST_STALE_TTL,
+                )
+    return _forecast_cache
+
+
+def forecast_cell(lat: float, lon: float) -> Tuple[float, float]:
+    """Snap a point to the centre of its forecast grid cell."""
+    return (round(round(lat / FORECAST_GRID_DEG) * FORECAST_GRID_DEG, 4),
+            round(round(lon / FORECAST_GRID_DEG) * FORECAST_GRID_DEG, 4))
+
+
+def next_issue_time(now: float = None) -> float:
+    """Epoch seconds at which the forecast issued before `now` is superseded."""
+    now = time.time() if now is None else now
+    period = FORECAST_ISSUE_HOURS * 3600
+    return (now // period + 1) * period
+
+
+def climatology(lat: float, lon: float, date: str) -> dict:
+    """A rough daily forecast from latitude and season alone, for when no real one is available.
+
+    Temperatures follow a cosine annual cycle peaking in late July (late
+    January south of the equator) whose amplitude grows with latitude.
+    Precipitation is left unknown.
+    """
+    day_of_year = datetime.strptime(date, "%Y-%m-%d").timetuple().tm_yday
+    season = math.cos(2 * math.pi * (day_of_year - 200) / 365.25)
+    if lat < 0:
+        season = -season
+    temp_max = 30 - 0.3 * abs(lat) + 0.25 * abs(lat) * season
+    return {
+        "temperature_2m_max": round(temp_max, 1),
+        "temperature_2m_min": round(temp_max - 8, 1),
+        "precipitation_sum": None,
+        "weathercode": None,
+    }
+
+
+def in_forecast_window(date: str) -> bool:
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        return False
+    today = datetime.utcnow().date()
+    return today <= day < today + timedelta(days=FORECAST_WINDOW_DAYS)
+
+
+def _nan_to_none(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+class DailySeries:
+    """An Open-Meteo `daily` block held as one typed array per field.
+
+    Temperatures and precipitation are float64 with NaN for missing values and
+    weather codes int16 with -1, so a long stay costs a few bytes per day
+    instead of a boxed Python float per value.
+    """
+
+    __slots__ = ("dates", "_row", "temp_max", "temp_min", "precipitation", "weathercode")
+
+    def __init__(self, daily: dict):
+        self.dates: List[str] = list(daily.get("time") or [])
+        self._row = {d: i for i, d in enumerate(self.dates)}
+        n = len(self.dates)
+        self.temp_max = self._floats(daily.get("temperature_2m_max"), n)
+        self.temp_min = self._floats(daily.get("temperature_2m_min"), n)
+        self.precipitation = self._floats(daily.get("precipitation_sum"), n)
+        codes = list(daily.get("weathercode") or [])[:n]
+        self.weathercode = array("h", (-1 if c is None else int(c) for c in codes))
+        self.weathercode.extend([-1] * (n - len(codes)))
+
+    @staticmethod
+    def _floats(values, n: int) -> array:
+        values = list(values or [])[:n]
+        col = array("d", (math.nan if v is None else float(v) for v in values))
+        col.extend([math.nan] * (n - len(values)))
+        return col
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def index(self, date: str) -> int:
+        """Row of `date`, or -1 if the series does not cover it."""
+        return self._row.get(date, -1)
+
+    def day(self, i: int) -> dict:
+        """Row `i` with Open-Meteo field names and None for missing values."""
+        code = self.weathercode[i]
+        return {
+            "temperature_2m_max": _nan_to_none(self.temp_max[i]),
+            "temperature_2m_min": _nan_to_none(self.temp_min[i]),
+            "precipitation_sum": _nan_to_none(self.precipitation[i]),
+            "weathercode": None if code < 0 else code,
+        }
+
 
 class WeatherAgent:
     @staticmethod
     def geocode_place(place_name: str):
+        """Return (lat, lon) for `place_name`.
+
+        Tries the offline gazetteer (if `GAZETTEER_PATH` is set), then the
+        on-disk cache, and only then Nominatim. If Nominatim fails or its
+        circuit is open, expired cached coordinates are used when available.
+        """
+        # imported here so `python -m agents.gazetteer` does not import itself twice
+        from agents.gazetteer import get_gazetteer
+
+        with span("geocode"):
+            gazetteer = get_gazetteer()
+            if gazetteer is not None:
+                coords = gazetteer.lookup(place_name)
+                incr("planner_cache_requests_total", cache="gazetteer", result="miss" if coords is None else "hit")
+                if coords is not None:
+                    return coords
+            key = normalize_place(place_name)
+            cache = get_geocode_cache()
+            cached = cache.get(key)
+            if cached is not None:
+                return cached[0], cached[1]
+
+            def fetch():
+                breaker = get_breaker("nominatim")
+                if breaker.rejecting():
+                    # skipped without a call: count it like a rejection by `breaker.call`
+                    breaker.count_rejection()
+                    return WeatherAgent._stale_geocode(place_name, key)
+                limiter = get_nominatim_limiter()
+                with span("nominatim_wait"):
+                    limiter.acquire()
+                # another thread or process may have resolved it while we queued for a token
+                hit = cache.get(key)
+                if hit is not None:
+                    limiter.refund()
+                    return hit[0], hit[1]
+                try:
+                    coords = WeatherAgent._geocode_remote(place_name)
+                except Exception as e:
+                    stale = cache.get(key, allow_stale=True)
+                    if stale is None:
+                        raise
+                    logger.warning("Geocoding %s failed (%s); using expired cached coordinates", place_name, e)
+                    return stale[0], stale[1]
+                cache.set(key, list(coords))
+                return coords
+
+            return _geocode_flight.do(key, fetch)
+
+    @staticmethod
+    def _stale_geocode(place_name: str, key: str):
+        """Fallback while the Nominatim circuit is open: an expired cache entry, if any."""
+        stale = get_geocode_cache().get(key, allow_stale=True)
+        if stale is None:
+            raise CircuitOpen(f"nominatim circuit is open and {place_name!r} has no cached coordinates")
+        return stale[0], stale[1]
+
+    @staticmethod
+    def _geocode_remote(place_name: str):
+        # the HTTP stack is imported on first use, keeping cached and offline lookups light
+        from agents.transport import get_transport
+
         params = {"q": place_name, "format": "json", "limit": 1}
-        resp = requests.get(NOMINATIM_URL, params=params, headers={"User-Agent": "ai-agent/1.0"}, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
+        limiter = get_nominatim_limiter()
+
+        def next_token():
+            # the caller took the first attempt's token; every retry needs its own
+            with span("nominatim_wait"):
+                limiter.acquire()
+
+        with span("nominatim"):
+            data = get_breaker("nominatim").call(get_transport().get_json, NOMINATIM_URL, params=params,
+                                                 before_retry=next_token)
         if not data:
             raise ValueError(f"Could not geocode place: {place_name}")
         return float(data[0]["lat"]), float(data[0]["lon"])
 
     @staticmethod
-    def run(destination: str, date: str):
-        """Return simplified weather info for `destination` on `date`.
+    def _fetch_forecast(params: dict):
+        """GET the Open-Meteo forecast for `params`; out-of-range dates are clamped by the transport."""
+        from agents.transport import get_transport
 
-        date: YYYY-MM-DD
-        """
-        lat, lon = WeatherAgent.geocode_place(destination)
-        # Open-Meteo daily forecast: choose commonly-supported daily fields
-        # `precipitation_probability_mean` may not be available on all endpoints, use `precipitation_sum` instead.
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum,weathercode",
-            "timezone": "UTC",
-            "start_date": date,
-            "end_date": date,
-        }
-        # allow one retry if the API says the requested date is out of allowed range
-        attempts = 0
-        while True:
-            resp = requests.get(OPEN_METEO_URL, params=params, timeout=10)
-            try:
-                resp.raise_for_status()
-                break
-            except Exception as e:
-                attempts += 1
-                # try to parse JSON error to detect allowed range
-                try:
-                    err = resp.json()
-                    reason = err.get("reason", "") if isinstance(err, dict) else ""
-                except Exception:
-                    reason = resp.text
-
-                if attempts == 1 and isinstance(reason, str) and "out of allowed range" in reason:
-                    # extract the allowed end date and retry with that end date
-                    import re
-
-                    m = re.search(r"from (\d{4}-\d{2}-\d{2}) to (\d{4}-\d{2}-\d{2})", reason)
-                    if m:
-                        allowed_start, allowed_end = m.group(1), m.group(2)
-                        # clamp requested start/end to allowed_end
-                        params["start_date"] = allowed_end
-                        params["end_date"] = allowed_end
-                        continue
+        with span("forecast"):
+            return get_breaker("open-meteo").call(get_transport().get_json, OPEN_METEO_URL, params=params, clamp_dates=True)
 
-                body = resp.text
-                raise RuntimeError(f"Open-Meteo request failed: {e}\nResponse body: {body}")
-        j = resp.json()
-        daily = j.get("daily", {})
-        if not daily:
-            raise ValueError("No weather data returned")
+    @staticmethod
+    def _fallback_weather(destination: str, date: str, lat: float, lon: float, error: Exception) -> dict:
+        """Weather when Open-Meteo failed or its circuit is open: a superseded cached window, else climatology."""
+        logger.warning("Forecast for %s unavailable (%s); using fallback", destination, error)
+        daily = get_forecast_cache().get(WeatherAgent._cell_key(forecast_cell(lat, lon)), allow_stale=True)
+        if daily and date in (daily.get("time") or []):
+            simplified = WeatherAgent._simplify(destination, date, lat, lon, daily, daily["time"].index(date))
+            simplified["source"] = "stale_forecast"
+        else:
+            simplified = WeatherAgent._summary(destination, date, lat, lon, climatology(lat, lon, date))
+            simplified["source"] = "climatology"
+        return simplified
+
+    @staticmethod
+    def _simplify(destination: str, date: str, lat: float, lon: float, daily: dict, index: int = 0) -> dict:
+        def pick(field):
+            values = daily.get(field) or []
+            return values[index] if index < len(values) else None
+
+        day = {field: pick(field) for field in DAILY_FIELDS.split(",")}
+        return WeatherAgent._summary(destination, date, lat, lon, day)
 
+    @staticmethod
+    def _summary(destination: str, date: str, lat: float, lon: float, day: dict) -> dict:
         simplified = {
             "destination": destination,
             "date": date,
             "lat": lat,
             "lon": lon,
-            "temp_max": daily.get("temperature_2m_max", [None])[0],
-            "temp_min": daily.get("temperature_2m_min", [None])[0],
-            "precipitation_sum_mm": daily.get("precipitation_sum", [None])[0],
-            "weathercode": daily.get("weathercode", [None])[0],
+            "temp_max": day.get("temperature_2m_max"),
+            "temp_min": day.get("temperature_2m_min"),
+            "precipitation_sum_mm": day.get("precipitation_sum"),
+            "weathercode": day.get("weathercode"),
         }
 
         # Derive a simple summary
@@ -99,3 +322,200 @@ class WeatherAgent:
 
         simplified["umbrella_recommendation"] = umbrella
         return simplified
+
+    @staticmethod
+    def _cell_key(cell: Tuple[float, float]) -> str:
+        return f"{cell[0]:.4f},{cell[1]:.4f}"
+
+    @staticmethod
+    def _slice_window(cell: Tuple[float, float], date: str):
+        """Return `(daily, index)` for `date` from the cached window of `cell`, or None."""
+        daily = get_forecast_cache().get(WeatherAgent._cell_key(cell))
+        if not daily:
+            return None
+        try:
+            return daily, daily.get("time", []).index(date)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _fetch_windows(cells: List[Tuple[float, float]]):
+        """Fetch and cache the full forecast window for each cell, batched per request."""
+        cache = get_forecast_cache()
+        expires_at = next_issue_time()
+        for start in range(0, len(cells), FORECAST_BATCH_SIZE):
+            chunk = cells[start:start + FORECAST_BATCH_SIZE]
+            params = {
+                "latitude": ",".join(str(c[0]) for c in chunk),
+                "longitude": ",".join(str(c[1]) for c in chunk),
+                "daily": DAILY_FIELDS,
+                "timezone": "UTC",
+                "forecast_days": FORECAST_WINDOW_DAYS,
+            }
+            j = WeatherAgent._fetch_forecast(params)
+            payloads = j if isinstance(j, list) else [j]
+            for cell, payload in zip(chunk, payloads):
+                daily = payload.get("daily") if isinstance(payload, dict) else None
+                if daily:
+                    cache.set(WeatherAgent._cell_key(cell), daily, expires_at=expires_at)
+
+    @staticmethod
+    def _cached_daily(lat: float, lon: float, date: str):
+        """Serve `date` at (lat, lon) by slicing a cached window, fetching the window on a miss."""
+        if not in_forecast_window(date):
+            return None
+        cell = forecast_cell(lat, lon)
+        hit = WeatherAgent._slice_window(cell, date)
+        if hit is None:
+            _forecast_flight.do(WeatherAgent._cell_key(cell), lambda: WeatherAgent._fetch_windows([cell]))
+            hit = WeatherAgent._slice_window(cell, date)
+        return hit
+
+    @staticmethod
+    def run(destination: str, date: str):
+        """Return simplified weather info for `destination` on `date`.
+
+        date: YYYY-MM-DD
+        If Open-Meteo fails or its circuit is open, the answer comes from a
+        superseded cached forecast or climatology, marked with `"source"`.
+        """
+        lat, lon = WeatherAgent.geocode_place(destination)
+        try:
+            return WeatherAgent._run_at(destination, date, lat, lon)
+        except Exception as e:
+            return WeatherAgent._fallback_weather(destination, date, lat, lon, e)
+
+    @staticmethod
+    def _run_at(destination: str, date: str, lat: float, lon: float) -> dict:
+        hit = WeatherAgent._cached_daily(lat, lon, date)
+        if hit is not None:
+            return WeatherAgent._simplify(destination, date, lat, lon, hit[0], hit[1])
+        # outside the cached window: ask for the single date (clamped if out of range)
+        # Open-Meteo daily forecast: choose commonly-supported daily fields
+        # `precipitation_probability_mean` may not be available on all endpoints, use `precipitation_sum` instead.
+        params = {
+            "latitude": lat,
+            "longitude": lon,
+            "daily": DAILY_FIELDS,
+            "timezone": "UTC",
+            "start_date": date,
+            "end_date": date,
+        }
+        j = WeatherAgent._fetch_forecast(params)
+        daily = j.get("daily", {})
+        if not daily:
+            raise ValueError("No weather data returned")
+        return WeatherAgent._simplify(destination, date, lat, lon, daily)
+
+    @staticmethod
+    def run_range(destination: str, start_date: str, days: int) -> List[dict]:
+        """Return simplified weather for `days` consecutive dates from `start_date`.
+
+        Stays inside the forecast window are sliced from the cached window of
+        the destination's grid cell (at most one request, none when cached);
+        otherwise the whole stay is fetched with a single `start_date..end_date`
+        request. Dates the forecast does not cover get `"umbrella_recommendation": "unknown"`;
+        if the forecast fails, every day falls back as in `run`.
+        """
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        dates = [(start + timedelta(days=k)).isoformat() for k in range(max(days, 1))]
+        lat, lon = WeatherAgent.geocode_place(destination)
+        series = None
+        try:
+            if in_forecast_window(dates[0]) and in_forecast_window(dates[-1]):
+                hit = WeatherAgent._cached_daily(lat, lon, dates[0])
+                if hit is not None:
+                    series = DailySeries(hit[0])
+            if series is None:
+                params = {
+                    "latitude": lat,
+                    "longitude": lon,
+                    "daily": DAILY_FIELDS,
+                    "timezone": "UTC",
+                    "start_date": dates[0],
+                    "end_date": dates[-1],
+                }
+                series = DailySeries(WeatherAgent._fetch_forecast(params).get("daily") or {})
+        except Exception as e:
+            return [WeatherAgent._fallback_weather(destination, date, lat, lon, e) for date in dates]
+        results = []
+        for date in dates:
+            i = series.index(date)
+            results.append(WeatherAgent._summary(destination, date, lat, lon, series.day(i) if i >= 0 else {}))
+        return results
+
+    @staticmethod
+    def run_many(destinations: List[str], dates: Union[str, List[str]]) -> List[dict]:
+        """Return simplified weather for many destinations with as few requests as possible.
+
+        `dates` is either one YYYY-MM-DD for every destination or a list aligned
+        with `destinations`. Points sharing a date are sent to Open-Meteo as
+        comma-separated coordinate lists, `FORECAST_BATCH_SIZE` per request;
+        dates inside the forecast window are sliced from the per-cell cache and
+        only the missing cells are fetched.
+        Destinations that cannot be geocoded get `{"destination", "date", "error"}`
+        instead of raising, so one bad name does not sink the whole batch; when
+        the forecast itself fails, stale or climatology weather is returned
+        (marked with `"source"`).
+        """
+        if isinstance(dates, str):
+            dates = [dates] * len(destinations)
+        if len(dates) != len(destinations):
+            raise ValueError("dates must be a single date or one per destination")
+
+        results: List[dict] = [None] * len(destinations)
+        by_date: Dict[str, List[Tuple[int, float, float]]] = {}
+        for i, (destination, date) in enumerate(zip(destinations, dates)):
+            try:
+                lat, lon = WeatherAgent.geocode_place(destination)
+            except Exception as e:
+                results[i] = {"destination": destination, "date": date, "error": str(e)}
+                continue
+            by_date.setdefault(date, []).append((i, lat, lon))
+
+        # serve what we can from cached forecast windows, fetching missing cells in one pass
+        windowed = [(i, lat, lon) for date, points in by_date.items() if in_forecast_window(date) for i, lat, lon in points]
+        missing = []
+        for i, lat, lon in windowed:
+            cell = forecast_cell(lat, lon)
+            if WeatherAgent._slice_window(cell, dates[i]) is None and cell not in missing:
+                missing.append(cell)
+        if missing:
+            try:
+                WeatherAgent._fetch_windows(missing)
+            except Exception as e:
+                logger.debug("Forecast window fetch failed, falling back to per-date requests: %s", e)
+        for i, lat, lon in windowed:
+            hit = WeatherAgent._slice_window(forecast_cell(lat, lon), dates[i])
+            if hit is not None:
+                results[i] = WeatherAgent._simplify(destinations[i], dates[i], lat, lon, hit[0], hit[1])
+
+        for date, points in by_date.items():
+            points = [p for p in points if results[p[0]] is None]
+            if not points:
+                continue
+            for start in range(0, len(points), FORECAST_BATCH_SIZE):
+                chunk = points[start:start + FORECAST_BATCH_SIZE]
+                params = {
+                    "latitude": ",".join(str(lat) for _, lat, _ in chunk),
+                    "longitude": ",".join(str(lon) for _, _, lon in chunk),
+                    "daily": DAILY_FIELDS,
+                    "timezone": "UTC",
+                    "start_date": date,
+                    "end_date": date,
+                }
+                try:
+                    j = WeatherAgent._fetch_forecast(params)
+                except Exception as e:
+                    for i, lat, lon in chunk:
+                        results[i] = WeatherAgent._fallback_weather(destinations[i], date, lat, lon, e)
+                    continue
+                # a single location comes back as an object, several as a list
+                payloads = j if isinstance(j, list) else [j]
+                for (i, lat, lon), payload in zip(chunk, payloads):
+                    daily = payload.get("daily", {}) if isinstance(payload, dict) else {}
+                    if not daily:
+                        results[i] = {"destination": destinations[i], "date": date, "error": "No weather data returned"}
+                        continue
+                    results[i] = WeatherAgent._simplify(destinations[i], date, lat, lon, daily)
+        return results
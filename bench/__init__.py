@@ -0,0 +1 @@
+"""Benchmarks for the planner agents."""
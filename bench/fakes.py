@@ -0,0 +1,159 @@
+"""Local stand-ins for Nominatim, Open-Meteo and the generative model.
+
+One threaded HTTP server answers all three:
+
+- `GET /search`        Nominatim-style geocoding (deterministic coordinates per name)
+- `GET /v1/forecast`   Open-Meteo daily forecast, single or comma-separated points
+- `POST /generate`     model endpoint for `LLM_ENDPOINT` ({"prompt"} -> {"text"})
+
+Each route has its own latency (mean plus uniform jitter) and error rate;
+injected errors are 503s, which the transport retries like real ones.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+ROUTES = ("geocode", "forecast", "llm")
+
+_PLACES = [
+    {"name": "Grand Museum", "type": "museum", "reason": "Indoor exhibits", "best_time": "morning"},
+    {"name": "Riverside Park", "type": "park", "reason": "Shady walks", "best_time": "afternoon"},
+    {"name": "Night Market", "type": "market", "reason": "Street food", "best_time": "evening"},
+]
+
+
+class RouteConfig:
+    __slots__ = ("latency", "jitter", "error_rate", "calls", "errors")
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+
+
+def _coords(name: str):
+    digest = hashlib.sha1(name.casefold().encode("utf-8")).digest()
+    return (int.from_bytes(digest[:4], "big") / 2 ** 32) * 120 - 60, (int.from_bytes(digest[4:8], "big") / 2 ** 32) * 360 - 180
+
+
+def _daily(start, days: int, seed: float) -> dict:
+    rnd = random.Random(seed)
+    return {
+        "time": [(start + timedelta(days=k)).isoformat() for k in range(days)],
+        "temperature_2m_max": [round(rnd.uniform(18, 34), 1) for _ in range(days)],
+        "temperature_2m_min": [round(rnd.uniform(10, 22), 1) for _ in range(days)],
+        "precipitation_sum": [rnd.choice([0.0, 0.0, 1.2, 7.5]) for _ in range(days)],
+        "weathercode": [rnd.choice([0, 1, 3, 61]) for _ in range(days)],
+    }
+
+
+class FakeUpstreams:
+    """Start with `start()`; point the agents at `base_url` (see `install`)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[Dict[str, RouteConfig]] = None):
+        self.routes = {name: RouteConfig() for name in ROUTES}
+        self.routes.update(config or {})
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeUpstreams":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-upstreams", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def install(self):
+        """Point `WeatherAgent` and `LocationAgent` at this server and lift the Nominatim rate limit."""
+        import os
+        from agents import weather_agent
+
+        weather_agent.NOMINATIM_URL = self.base_url + "/search"
+        weather_agent.OPEN_METEO_URL = self.base_url + "/v1/forecast"
+        weather_agent.NOMINATIM_RATE_PER_S = 1e9
+        os.environ["LLM_ENDPOINT"] = self.base_url + "/generate"
+
+    def counters(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {name: {"calls": r.calls, "errors": r.errors} for name, r in self.routes.items()}
+
+    def _admit(self, route: str) -> bool:
+        """Sleep for the route's latency; False means this call should fail."""
+        cfg = self.routes[route]
+        with self._lock:
+            cfg.calls += 1
+            fail = random.random() < cfg.error_rate
+            if fail:
+                cfg.errors += 1
+        delay = cfg.latency + random.uniform(0, cfg.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        return not fail
+
+    def _handler(self):
+        upstreams = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if url.path == "/search":
+                    if not upstreams._admit("geocode"):
+                        return self._send(503, {"error": "injected"})
+                    lat, lon = _coords(query.get("q", ""))
+                    return self._send(200, [{"lat": f"{lat:.6f}", "lon": f"{lon:.6f}"}])
+                if url.path == "/v1/forecast":
+                    if not upstreams._admit("forecast"):
+                        return self._send(503, {"error": "injected"})
+                    if "start_date" in query:
+                        start = datetime.strptime(query["start_date"], "%Y-%m-%d").date()
+                        days = (datetime.strptime(query.get("end_date", query["start_date"]), "%Y-%m-%d").date() - start).days + 1
+                    else:
+                        start, days = datetime.utcnow().date(), int(query.get("forecast_days", 7))
+                    lats = query.get("latitude", "0").split(",")
+                    lons = query.get("longitude", "0").split(",")
+                    payloads = [{"latitude": float(la), "longitude": float(lo), "daily": _daily(start, days, float(la) + float(lo))}
+                                for la, lo in zip(lats, lons)]
+                    return self._send(200, payloads if len(payloads) > 1 else payloads[0])
+                self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                if urlsplit(self.path).path != "/generate":
+                    return self._send(404, {"error": "not found"})
+                if not upstreams._admit("llm"):
+                    return self._send(503, {"error": "injected"})
+                self._send(200, {"text": json.dumps(_PLACES)})
+
+        return Handler
@@ -0,0 +1,234 @@
+"""Planner benchmark harness
+
+Runs the agents against local stand-in upstreams (see `bench.fakes`) so runs
+are repeatable and never touch the public endpoints.
+
+Usage examples:
+  python -m bench.run --iterations 200 --concurrency 8 --out bench_results.json
+  python -m bench.run --targets main,weather --latency geocode=0.05,forecast=0.08,llm=0.4 --error-rate 0.02
+  python -m bench.run --out after.json --compare before.json
+
+Every run starts with empty caches in a temporary `AGENT_CACHE_DIR`; targets
+run in the order given and share those caches. `--distinct` controls how many
+different destinations the iterations cycle through, and therefore the cache
+hit rate.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+TARGETS = ("main", "weather", "location", "cost")
+
+
+def _per_route(spec: str, default: float) -> Dict[str, float]:
+    """Parse "0.1" or "geocode=0.05,llm=0.4" into a value per fake route."""
+    from bench.fakes import ROUTES
+
+    values = {route: default for route in ROUTES}
+    if not spec:
+        return values
+    if "=" not in spec:
+        return {route: float(spec) for route in ROUTES}
+    for part in spec.split(","):
+        route, _, value = part.partition("=")
+        if route not in values:
+            raise SystemExit(f"unknown route {route!r}; expected one of {', '.join(ROUTES)}")
+        values[route] = float(value)
+    return values
+
+
+def _percentile(sorted_values: List[float], q: float):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def _mean(values):
+    return round(sum(values) / len(values), 1) if values else None
+
+
+def _workload(target: str, date: str, distinct: int) -> Callable[[int], object]:
+    from agents.cost_agent import CostAgent
+    from agents.location_agent import LocationAgent
+    from agents.weather_agent import WeatherAgent
+    import main
+
+    def dest(i):
+        return f"Bench City {i % distinct}, Testland"
+
+    if target == "main":
+        return lambda i: main.main(["--destination", dest(i), "--date", date, "--origin", "Bench Origin, Testland"])
+    if target == "weather":
+        return lambda i: WeatherAgent.run(dest(i), date)
+    if target == "location":
+        umbrellas = ("low", "possible", "high")
+        return lambda i: LocationAgent.run(
+            {"date": date, "temp_max": 20 + (i % distinct) % 15, "umbrella_recommendation": umbrellas[i % 3]}, dest(i))
+    places = LocationAgent.heuristic("Bench City", {"umbrella_recommendation": "high"})
+    return lambda i: CostAgent.run(places, origin_coords=(-6.2, 106.8), dest_coords=(-7.8 + i % 7, 110.4), nights=1 + i % 3)
+
+
+def _measure_latency(fn: Callable[[int], object], iterations: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            fn(i)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    wall = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        for elapsed, error in ex.map(one, range(iterations)):
+            latencies.append(elapsed)
+            errors += error is not None
+    wall = time.perf_counter() - wall
+
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(iterations / wall, 2) if wall else None,
+        "latency_ms": {
+            "mean": _ms(sum(latencies) / len(latencies)) if latencies else None,
+            "p50": _ms(_percentile(latencies, 0.50)),
+            "p95": _ms(_percentile(latencies, 0.95)),
+            "p99": _ms(_percentile(latencies, 0.99)),
+            "max": _ms(latencies[-1] if latencies else None),
+        },
+    }
+
+
+def _measure_allocations(fn: Callable[[int], object], samples: int, offset: int) -> dict:
+    """Sequential calls under tracemalloc: peak and retained bytes, net new blocks per call."""
+    peaks, retained, blocks = [], [], []
+    tracemalloc.start()
+    try:
+        for i in range(samples):
+            before, _ = tracemalloc.get_traced_memory()
+            blocks_before = sys.getallocatedblocks()
+            tracemalloc.reset_peak()
+            try:
+                fn(offset + i)
+            except Exception:
+                pass
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(after - before)
+            blocks.append(sys.getallocatedblocks() - blocks_before)
+    finally:
+        tracemalloc.stop()
+    return {
+        "samples": samples,
+        "peak_kib_per_call": _mean([p / 1024 for p in peaks]),
+        "retained_kib_per_call": _mean([r / 1024 for r in retained]),
+        "net_blocks_per_call": _mean(blocks),
+    }
+
+
+def _compare(current: dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    print(f"\nchange vs {baseline_path}:")
+    for target, now in current["results"].items():
+        before = baseline.get("results", {}).get(target)
+        if not before:
+            continue
+        parts = []
+        for label, path in (("p50", ("latency_ms", "p50")), ("p95", ("latency_ms", "p95")),
+                            ("p99", ("latency_ms", "p99")), ("throughput", ("throughput_per_s",))):
+            old, new = before, now
+            for key in path:
+                old, new = (old or {}).get(key), (new or {}).get(key)
+            if old and new is not None:
+                parts.append(f"{label} {old} -> {new} ({(new - old) / old * 100:+.1f}%)")
+        print(f"  {target:9s} " + "; ".join(parts))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m bench.run")
+    p.add_argument("--targets", default=",".join(TARGETS), help=f"comma-separated subset of {', '.join(TARGETS)}")
+    p.add_argument("--iterations", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--distinct", type=int, default=50, help="number of distinct destinations cycled through")
+    p.add_argument("--latency", default="geocode=0.03,forecast=0.05,llm=0.25", help="seconds per route, e.g. llm=0.4")
+    p.add_argument("--jitter", default="0.01", help="extra uniform latency per route, seconds")
+    p.add_argument("--error-rate", default="0", help="fraction of calls answered with 503, per route")
+    p.add_argument("--alloc-samples", type=int, default=20, help="sequential calls traced for allocations (0 to skip)")
+    p.add_argument("--out", default=None, help="write JSON results here")
+    p.add_argument("--compare", default=None, help="baseline JSON to diff against")
+    args = p.parse_args(argv)
+    # configure logging before `main` runs so its INFO basicConfig is a no-op
+    logging.basicConfig(level=logging.WARNING)
+
+    targets = [t for t in args.targets.split(",") if t]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        p.error(f"unknown targets: {', '.join(sorted(unknown))}")
+
+    os.environ["AGENT_CACHE_DIR"] = tempfile.mkdtemp(prefix="planner-bench-")
+    from agents.metrics import snapshot
+    from bench.fakes import FakeUpstreams, RouteConfig
+
+    latency, jitter, error_rate = _per_route(args.latency, 0.0), _per_route(args.jitter, 0.0), _per_route(args.error_rate, 0.0)
+    upstreams = FakeUpstreams(config={r: RouteConfig(latency[r], jitter[r], error_rate[r]) for r in latency}).start()
+    upstreams.install()
+
+    date = (datetime.utcnow().date() + timedelta(days=2)).isoformat()
+    results = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) as sink:
+            for target in targets:
+                fn = _workload(target, date, args.distinct)
+                results[target] = _measure_latency(fn, args.iterations, args.concurrency)
+                if args.alloc_samples:
+                    results[target]["allocations"] = _measure_allocations(fn, args.alloc_samples, args.iterations)
+                sink.seek(0)
+                sink.truncate()
+    finally:
+        upstreams.stop()
+
+    report = {
+        "started": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "upstream_calls": upstreams.counters(),
+        "metrics": snapshot(),
+        "results": results,
+    }
+    for target, r in results.items():
+        lat = r["latency_ms"]
+        alloc = r.get("allocations", {})
+        print(f"{target:9s} {r['throughput_per_s']:>9} /s  p50 {lat['p50']} ms  p95 {lat['p95']} ms  p99 {lat['p99']} ms  "
+              f"errors {r['errors']}  peak {alloc.get('peak_kib_per_call')} KiB/call")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"results written to {args.out}")
+    if args.compare:
+        _compare(report, args.compare)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -2,101 +2,145 @@
 
 Usage examples:
   python main.py --destination "Bali, Indonesia" --date 2025-12-20 --origin "Jakarta, Indonesia"
+  python main.py --destination "Bali, Indonesia" --date 2025-12-20 --stream
+  python main.py --batch trips.jsonl --output plans.jsonl --workers 16
+
+The agents (and the HTTP client, numpy and the model SDK behind them) are
+imported only after the arguments are parsed, so `--help` and argument errors
+return without loading them; `--profile-startup` reports where startup went.
 """
-import argparse
-import json
-import logging
-from concurrent.futures import ThreadPoolExecutor
+import time
+
+# taken before the remaining imports on purpose: --profile-startup reports
+# everything main.py loads, so those imports come after it (hence the noqa)
+_STARTED = time.perf_counter()
 
-from agents.weather_agent import WeatherAgent
-from agents.location_agent import LocationAgent
-from agents.cost_agent import CostAgent
-from agents.session import InMemorySessionService
+import argparse  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+import sys  # noqa: E402
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+# modules worth reporting in --profile-startup when something pulls them in
+HEAVY_MODULES = ("requests", "numpy", "google.generativeai")
 
 
 def geocode(place):
     # reuse weather agent geocoder
+    from agents.weather_agent import WeatherAgent
+
     return WeatherAgent.geocode_place(place)
 
 
-def main():
+def main(argv=None):
     p = argparse.ArgumentParser()
-    p.add_argument("--destination", required=True)
-    p.add_argument("--date", required=True, help="YYYY-MM-DD")
+    p.add_argument("--destination")
+    p.add_argument("--date", help="YYYY-MM-DD")
     p.add_argument("--origin", required=False, default=None)
     p.add_argument("--nights", type=int, default=1)
     p.add_argument("--hotel_tier", choices=["budget", "mid", "premium"], default="mid")
-    args = p.parse_args()
-
-    destination = args.destination
-    date = args.date
-
-    logger.info("Starting planner for %s on %s", destination, date)
-
-    # Create a session for this planning run
-    session_id = InMemorySessionService.create_session({"destination": destination, "date": date})
-
-    # Parallelize weather fetch and origin geocoding (if origin provided)
-    with ThreadPoolExecutor(max_workers=2) as ex:
-        weather_fut = ex.submit(WeatherAgent.run, destination, date)
-        if args.origin:
-            origin_fut = ex.submit(geocode, args.origin)
-        else:
-            origin_fut = None
-
-        logger.info("Waiting for weather and origin geocode results")
-        weather = weather_fut.result()
-        if origin_fut:
-            origin_coords = origin_fut.result()
-        else:
-            origin_coords = (weather.get("lat"), weather.get("lon"))
-
-    logger.info("Weather fetched: lat=%s lon=%s", weather.get("lat"), weather.get("lon"))
-
-    # Run LocationAgent (sequentially after weather available)
-    logger.info("Running LocationAgent...")
-    places = LocationAgent.run(weather, destination)
-
-    dest_coords = (weather.get("lat"), weather.get("lon"))
-
-    logger.info("Running CostAgent...")
-    cost = CostAgent.run(places, origin_coords=origin_coords, dest_coords=dest_coords, nights=args.nights, hotel_tier=args.hotel_tier)
-
-    # Simple evaluator: score places based on weather and type preferences
-    def evaluate_places(places_list, weather_info):
-        scores = []
-        umbrella = weather_info.get("umbrella_recommendation", "unknown")
-        for p in places_list:
-            score = 50
-            t = p.get("type", "tour")
-            if umbrella == "high" and t in ("museum", "mall", "market", "brewery"):
-                score += 30
-            if umbrella == "low" and t in ("beach", "park", "garden"):
-                score += 20
-            # temperature preference
-            temp = weather_info.get("temp_max") or 25
-            if temp >= 28 and t == "beach":
-                score += 10
-            scores.append({"name": p.get("name"), "score": score})
-        return scores
-
-    eval_scores = evaluate_places(places, weather)
-    logger.info("Evaluation scores: %s", eval_scores)
-
-    final = {
-        "destination": destination,
-        "date": date,
-        "weather": weather,
-        "recommended_places": places,
-        "costs": cost,
-        "session_id": session_id,
-        "evaluation": eval_scores,
-    }
-
-    print(json.dumps(final, indent=2, ensure_ascii=False))
+    p.add_argument("--budget", type=float, default=None, help="overall latency budget in seconds; slow steps are degraded")
+    p.add_argument("--model-slo", type=float, default=None,
+                   help="seconds to wait for the model before falling back to the heuristic")
+    p.add_argument("--itinerary", action="store_true", help="order the recommended places into a priced day route")
+    p.add_argument("--batch", metavar="INPUT_JSONL", help="plan every request in a JSONL file ('-' for stdin)")
+    p.add_argument("--output", default="-", help="where --batch writes JSONL results (default stdout)")
+    p.add_argument("--workers", type=int, default=8, help="concurrent plans in --batch mode")
+    p.add_argument("--catalog", metavar="PLACES_JSON",
+                   help="JSON list of candidate places ({name, type, ...}) ranked together with the recommendations")
+    p.add_argument("--top-n", type=int, default=None, help="number of places to keep after ranking")
+    p.add_argument("--stream", action="store_true",
+                   help="print one JSON event per line as each stage completes, ending with the full plan")
+    p.add_argument("--no-memo", action="store_true",
+                   help="recompute every step instead of reusing stored results from earlier runs")
+    p.add_argument("--metrics-dump", metavar="PATH", default=None,
+                   help="write span histograms and counters in Prometheus text format ('-' for stderr)")
+    p.add_argument("--profile-startup", action="store_true",
+                   help="report interpreter-to-plan startup time and which heavy modules were loaded (stderr)")
+    parsed = time.perf_counter()
+    args = p.parse_args(argv)
+    parsed_ms = (time.perf_counter() - parsed) * 1000
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    before = time.perf_counter()
+    from agents.pipeline import StepMemo, plan, plan_stream
+
+    if args.profile_startup:
+        profile_startup(parsed - _STARTED, parsed_ms, time.perf_counter() - before)
+
+    if args.batch:
+        run_batch(args)
+        dump_metrics(args.metrics_dump)
+        return
+    if not args.destination or not args.date:
+        p.error("--destination and --date are required unless --batch is given")
+
+    options = dict(
+        origin=args.origin,
+        nights=args.nights,
+        hotel_tier=args.hotel_tier,
+        budget=args.budget,
+        model_slo=args.model_slo,
+        itinerary=args.itinerary,
+        memo=None if args.no_memo else StepMemo(),
+        candidates=load_catalog(args.catalog) if args.catalog else None,
+        top_n=args.top_n,
+    )
+    if args.stream:
+        for event in plan_stream(args.destination, args.date, **options):
+            sys.stdout.write(json.dumps(event, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+    else:
+        final = plan(args.destination, args.date, **options)
+        print(json.dumps(final, indent=2, ensure_ascii=False))
+    dump_metrics(args.metrics_dump)
+
+
+def load_catalog(path):
+    with open(path, encoding="utf-8") as fh:
+        places = json.load(fh)
+    if not isinstance(places, list):
+        raise SystemExit(f"{path}: expected a JSON list of places")
+    return places
+
+
+def profile_startup(main_import_s, argparse_ms, agents_import_s):
+    sys.stderr.write(
+        "startup: main.py + parser {:.1f} ms, parse {:.1f} ms, agents import {:.1f} ms, "
+        "{:.1f} ms since main.py started; {} modules loaded; heavy: {}\n".format(
+            main_import_s * 1000, argparse_ms, agents_import_s * 1000,
+            (time.perf_counter() - _STARTED) * 1000, len(sys.modules),
+            ", ".join(m for m in HEAVY_MODULES if m in sys.modules) or "none",
+        )
+    )
+
+
+def dump_metrics(path):
+    if not path:
+        return
+    from agents.metrics import prometheus_text
+
+    if path == "-":
+        sys.stderr.write(prometheus_text())
+        return
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(prometheus_text())
+
+
+def run_batch(args):
+    from agents.pipeline import plan_batch
+
+    src = sys.stdin if args.batch == "-" else open(args.batch, encoding="utf-8")
+    dst = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        counts = plan_batch(src, dst, workers=args.workers, budget=args.budget, model_slo=args.model_slo)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+    logger.info("Batch finished: %d ok, %d failed, %d shared results reused", counts["ok"], counts["error"], counts["memo_hits"])
 
 
 if __name__ == "__main__":
@@ -1,5 +1,8 @@
 # Projekt Full ADK Multi-Agent System with Gemini-2.0-Flash
 
+import math
+from array import array
+
 from adk import Agent, Tool, Router
 import requests
 from openai import OpenAI
@@ -19,30 +22,88 @@ DEFAULT_MODEL = "gemini-2.0-flash"
 # ------------------------------------------------------------
 # Weather Agent (Free Weather API: Open-Meteo.com)
 # ------------------------------------------------------------
+HOURLY_FIELDS = ("temperature_2m", "precipitation")
+# precipitation (mm) from which an hour counts as rainy
+RAINY_HOUR_MM = 0.1
+
+
+class HourlySeries:
+    """Hourly forecast columns as float32 arrays (NaN where Open-Meteo has no value)."""
+
+    __slots__ = ("hours", "temperature", "precipitation")
+
+    def __init__(self, hourly: dict):
+        # Why: "2025-07-10T13:00" -> 13; the whole series is one local day
+        self.hours = array("b", (int(t[11:13]) for t in hourly.get("time", [])))
+        self.temperature = _column(hourly.get("temperature_2m"), len(self.hours))
+        self.precipitation = _column(hourly.get("precipitation"), len(self.hours))
+
+    def summary(self) -> dict:
+        temps = [t for t in self.temperature if not math.isnan(t)]
+        precip = [p for p in self.precipitation if not math.isnan(p)]
+        rainy = [h for h, p in zip(self.hours, self.precipitation) if p >= RAINY_HOUR_MM]
+        # Why: None (unknown), not 0 mm (dry), when Open-Meteo sent no precipitation values
+        return {
+            "temp_min": round(min(temps), 1) if temps else None,
+            "temp_max": round(max(temps), 1) if temps else None,
+            "temp_avg": round(sum(temps) / len(temps), 1) if temps else None,
+            "precipitation_mm": round(sum(precip), 1) if precip else None,
+            "rainy_hours": _hour_ranges(rainy) if precip else None,
+        }
+
+
+def _column(values, n: int) -> array:
+    values = values or []
+    return array("f", (math.nan if v is None else v for v in values[:n])) + array("f", [math.nan]) * (n - len(values))
+
+
+def _hour_ranges(hours) -> str:
+    # Why: "6-8,15" is far fewer prompt tokens than a list of hours
+    ranges = []
+    for h in hours:
+        if ranges and ranges[-1][1] == h - 1:
+            ranges[-1][1] = h
+        else:
+            ranges.append([h, h])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
 class WeatherTool(Tool):
     name = "get_weather"
-    description = "Get weather forecast using Open-Meteo API (free)."
+    description = "Get a one-day weather summary using Open-Meteo API (free)."
 
     def run(self, destination: str, date: str) -> dict:
         # Why: Open-Meteo is free and good for real use
         geocode_url = "https://geocoding-api.open-meteo.com/v1/search"
-        geo = requests.get(geocode_url, params={"name": destination}).json()
+        geo = requests.get(geocode_url, params={"name": destination, "count": 1}, timeout=10).json()
 
-        if "results" not in geo:
+        if not geo.get("results"):
             return {"error": "Destination not found"}
 
         lat = geo["results"][0]["latitude"]
         lon = geo["results"][0]["longitude"]
 
+        # Why: only the trip day and the fields we summarise, not the whole multi-day hourly forecast
         weather_url = "https://api.open-meteo.com/v1/forecast"
         weather = requests.get(weather_url, params={
             "latitude": lat,
             "longitude": lon,
-            "hourly": "temperature_2m,precipitation",
+            "hourly": ",".join(HOURLY_FIELDS),
+            "start_date": date,
+            "end_date": date,
             "timezone": "auto"
-        }).json()
+        }, timeout=10).json()
 
-        return weather
+        if weather.get("error"):
+            return {"error": weather.get("reason", "Forecast not available")}
+
+        return {
+            "destination": destination,
+            "date": date,
+            "lat": lat,
+            "lon": lon,
+            **HourlySeries(weather.get("hourly", {})).summary(),
+        }
 
 
 weather_agent = Agent(
@@ -61,12 +122,12 @@ class LocationTool(Tool):
     description = "Generate location recommendations using Gemini."
 
     def run(self, destination: str, weather: dict) -> dict:
-        # Why: Use LLM to reason based on weather patterns
+        # Why: Use LLM to reason based on weather patterns; the summary keeps the prompt short
         prompt = f"""
         Kamu adalah expert wisata.
         Berdasarkan cuaca berikut:
 
-        {weather}
+        {_weather_line(weather)}
 
         Rekomendasikan 5 tempat wisata yang cocok di {destination}
         Format JSON: {{"places": [...]}}
@@ -78,6 +139,20 @@ class LocationTool(Tool):
         return res.choices[0].message.parsed
 
 
+def _weather_line(weather: dict) -> str:
+    if weather.get("error"):
+        return f"tidak tersedia ({weather['error']})"
+    if weather.get("temp_max") is None:
+        temp = "suhu tidak tersedia"
+    else:
+        temp = f"suhu {weather.get('temp_min')}-{weather.get('temp_max')}°C (rata-rata {weather.get('temp_avg')}°C)"
+    if weather.get("precipitation_mm") is None:
+        rain = "data hujan tidak tersedia"
+    else:
+        rain = f"hujan {weather['precipitation_mm']} mm, jam hujan: {weather.get('rainy_hours') or '-'}"
+    return f"{weather.get('date')}: {temp}, {rain}"
+
+
 location_agent = Agent(
     name="location_agent",
     model=DEFAULT_MODEL,
@@ -0,0 +1,255 @@
+"""Planner HTTP service
+
+Keeps agents, connection pools and caches warm in one long-running process.
+
+Usage examples:
+  python server.py --port 8080 --workers 8 --queue 64
+  curl -X POST localhost:8080/plan -d '{"destination": "Bali, Indonesia", "date": "2025-12-20"}'
+  curl localhost:8080/stats
+  curl localhost:8080/metrics    # Prometheus text format
+
+Requests are admitted into a bounded queue served by a fixed pool of workers;
+when the queue is full the server answers 503 straight away instead of
+letting latency grow without bound.
+"""
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from agents.breaker import breaker_stats
+from agents.location_agent import get_recommendation_cache
+from agents.metrics import prometheus_text
+from agents.pipeline import plan
+from agents.session import SqliteSessionService, get_session_service, set_session_backend
+from agents.weather_agent import get_forecast_cache, get_geocode_cache, get_nominatim_limiter
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+HOTEL_TIERS = ("budget", "mid", "premium")
+
+
+def parse_plan_request(params) -> dict:
+    """Validate a `POST /plan` body and convert its fields; raises ValueError with a client-facing message."""
+    if not isinstance(params, dict) or not params.get("destination") or not params.get("date"):
+        raise ValueError("body must be a JSON object with 'destination' and 'date'")
+    if not isinstance(params["destination"], str):
+        raise ValueError("'destination' must be a string")
+    origin = params.get("origin")
+    if origin is not None and not isinstance(origin, str):
+        raise ValueError("'origin' must be a string")
+    try:
+        datetime.strptime(params["date"], "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise ValueError("'date' must be a YYYY-MM-DD string")
+    nights = params.get("nights", 1)
+    if isinstance(nights, bool) or not isinstance(nights, (int, str)):
+        raise ValueError("'nights' must be a positive integer")
+    try:
+        nights = int(nights)
+    except ValueError:
+        raise ValueError("'nights' must be a positive integer")
+    if nights < 1:
+        raise ValueError("'nights' must be a positive integer")
+    hotel_tier = params.get("hotel_tier", "mid")
+    if hotel_tier not in HOTEL_TIERS:
+        raise ValueError(f"'hotel_tier' must be one of {', '.join(HOTEL_TIERS)}")
+    parsed = dict(params, nights=nights, hotel_tier=hotel_tier)
+    for key in ("budget", "model_slo"):
+        value = params.get(key)
+        if value is not None:
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+                raise ValueError(f"'{key}' must be a positive number of seconds")
+            parsed[key] = float(value)
+    return parsed
+
+
+class _Job:
+    __slots__ = ("params", "done", "result", "error", "enqueued")
+
+    def __init__(self, params: dict):
+        self.params = params
+        self.done = threading.Event()
+        self.result: Optional[dict] = None
+        self.error: Optional[BaseException] = None
+        self.enqueued = time.monotonic()
+
+
+class PlannerService:
+    """Bounded job queue, worker pool and live latency/queue statistics."""
+
+    def __init__(self, workers: int = 8, queue_size: int = 64, budget: Optional[float] = None,
+                 model_slo: Optional[float] = None, window: int = 1024):
+        self.budget = budget
+        self.model_slo = model_slo
+        self.workers = workers
+        self._queue: "queue.Queue[_Job]" = queue.Queue(maxsize=queue_size)
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._counts = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0}
+        self._in_flight = 0
+        self._started = time.time()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"planner-worker-{i}", daemon=True).start()
+
+    def submit(self, params: dict) -> Optional[_Job]:
+        """Queue a plan request; returns None when the queue is saturated."""
+        job = _Job(params)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._counts["rejected"] += 1
+            return None
+        with self._lock:
+            self._counts["accepted"] += 1
+        return job
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._in_flight += 1
+            p = job.params
+            try:
+                job.result = plan(
+                    p["destination"],
+                    p["date"],
+                    origin=p.get("origin"),
+                    nights=p["nights"],
+                    hotel_tier=p["hotel_tier"],
+                    budget=p.get("budget", self.budget),
+                    model_slo=p.get("model_slo", self.model_slo),
+                    itinerary=bool(p.get("itinerary", False)),
+                )
+            except BaseException as e:
+                job.error = e
+            finally:
+                elapsed = time.monotonic() - job.enqueued
+                with self._lock:
+                    self._in_flight -= 1
+                    self._counts["failed" if job.error else "completed"] += 1
+                    self._latencies.append(elapsed)
+                job.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counts = dict(self._counts)
+            in_flight = self._in_flight
+
+        def pct(q):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1)
+
+        return {
+            "uptime_s": round(time.time() - self._started, 1),
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "in_flight": in_flight,
+            **counts,
+            "latency_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "samples": len(latencies)},
+            "caches": {
+                "geocode": get_geocode_cache().stats(),
+                "forecast": get_forecast_cache().stats(),
+                "recommendations": get_recommendation_cache().stats(),
+            },
+            "nominatim_limiter": get_nominatim_limiter().stats(),
+            "breakers": breaker_stats(),
+            "sessions": get_session_service().stats(),
+        }
+
+
+class PlannerHandler(BaseHTTPRequestHandler):
+    service: PlannerService = None
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, body: dict, headers: Optional[dict] = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send(200, self.service.stats())
+        elif self.path == "/metrics":
+            data = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif self.path == "/healthz":
+            self._send(200, {"status": "ok"})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/plan":
+            self._send(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            params = parse_plan_request(json.loads(self.rfile.read(length) or b"{}"))
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+
+        job = self.service.submit(params)
+        if job is None:
+            self._send(503, {"error": "planner busy, retry later"}, {"Retry-After": "1"})
+            return
+        job.done.wait()
+        if job.error is not None:
+            logger.warning("Plan failed: %s", job.error)
+            self._send(502, {"error": f"{type(job.error).__name__}: {job.error}"})
+        else:
+            self._send(200, job.result)
+
+    def log_message(self, format, *args):
+        logger.debug("%s " + format, self.address_string(), *args)
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8080)
+    p.add_argument("--workers", type=int, default=8, help="plans executed concurrently")
+    p.add_argument("--queue", type=int, default=64, help="requests allowed to wait before answering 503")
+    p.add_argument("--budget", type=float, default=None, help="default per-plan latency budget in seconds")
+    p.add_argument("--model-slo", type=float, default=None, help="default seconds to wait for the model before using the heuristic")
+    p.add_argument("--session-db", default=None, help="SQLite file for durable sessions (default: in-memory)")
+    args = p.parse_args()
+
+    if args.session_db:
+        set_session_backend(SqliteSessionService(args.session_db))
+
+    PlannerHandler.service = PlannerService(workers=args.workers, queue_size=args.queue, budget=args.budget,
+                                            model_slo=args.model_slo)
+    httpd = ThreadingHTTPServer((args.host, args.port), PlannerHandler)
+    logger.info("Planner service listening on http://%s:%d", args.host, args.port)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# run against the checkout without installing it, and keep caches per process
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AGENT_CACHE_DIR", ":memory:")
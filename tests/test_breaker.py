@@ -0,0 +1,117 @@
+import pytest
+
+from agents import breaker
+from agents.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, is_upstream_failure
+from agents.transport import HttpError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(breaker, "time", clock)
+    return clock
+
+
+def fail(error=None):
+    def fn():
+        raise error or ConnectionError("down")
+    return fn
+
+
+def call(b, fn):
+    try:
+        return b.call(fn)
+    except Exception as e:
+        return e
+
+
+def test_opens_on_failure_ratio(clock):
+    b = CircuitBreaker("t", window=10, min_calls=4, failure_ratio=0.5)
+    for fn in (lambda: 1, fail(), lambda: 1):
+        call(b, fn)
+    assert b.state == CLOSED  # below min_calls
+    call(b, fail())
+    assert b.state == OPEN
+    assert b.stats()["opened"] == 1
+
+
+def test_open_rejects_without_calling(clock):
+    b = CircuitBreaker("t", min_calls=1, open_for=30)
+    call(b, fail())
+    calls = []
+    assert isinstance(call(b, lambda: calls.append(1)), CircuitOpen)
+    assert calls == []
+    assert b.rejecting()
+    assert b.stats()["rejected"] == 1
+
+
+def test_half_open_probe_success_closes(clock):
+    b = CircuitBreaker("t", min_calls=1, open_for=30)
+    call(b, fail())
+    clock.now += 30
+    assert not b.rejecting()
+    assert b.allow()
+    assert b.state == HALF_OPEN
+    # only one probe at a time
+    assert not b.allow()
+    b.record(False, 0.1)
+    assert b.state == CLOSED
+    assert b.stats()["window_calls"] == 0
+
+
+def test_half_open_probe_failure_reopens(clock):
+    b = CircuitBreaker("t", min_calls=1, open_for=30)
+    call(b, fail())
+    clock.now += 30
+    call(b, fail())
+    assert b.state == OPEN
+    assert b.stats()["opened"] == 2
+    clock.now += 29
+    assert b.rejecting()
+
+
+def test_slow_calls_open_the_circuit(clock):
+    b = CircuitBreaker("t", min_calls=3, slow_call_s=1.0, slow_ratio=0.6)
+
+    def slow():
+        clock.now += 2.0
+        return "ok"
+
+    for _ in range(3):
+        assert call(b, slow) == "ok"
+    assert b.state == OPEN
+
+
+def test_slow_probe_reopens(clock):
+    b = CircuitBreaker("t", min_calls=1, slow_call_s=1.0, open_for=5)
+    call(b, fail())
+    clock.now += 5
+    assert b.allow()
+    b.record(False, 3.0)
+    assert b.state == OPEN
+
+
+def test_client_errors_do_not_count(clock):
+    b = CircuitBreaker("t", min_calls=2)
+    for _ in range(5):
+        call(b, fail(HttpError("bad date", 400)))
+    assert b.state == CLOSED
+    assert b.stats()["window_failures"] == 0
+    call(b, fail(HttpError("busy", 429)))
+    call(b, fail(HttpError("down", 503)))
+    assert b.stats()["window_failures"] == 2
+
+
+def test_is_upstream_failure():
+    assert is_upstream_failure(TimeoutError())
+    assert is_upstream_failure(HttpError("x", 500))
+    assert is_upstream_failure(HttpError("x", 429))
+    assert not is_upstream_failure(HttpError("x", 404))
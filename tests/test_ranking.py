@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from agents import ranking
+from agents.ranking import Ranker, evaluate_places, top_places
+
+TYPES = ("museum", "mall", "market", "brewery", "beach", "park", "garden", "cafe", "tour", "walking", "zoo")
+UMBRELLAS = ("low", "possible", "high", "unknown", None, "bogus")
+
+
+def reference_score(place, weather):
+    """The scorer `evaluate_places` replaced, kept verbatim as the reference."""
+    score = 50
+    umbrella = weather.get("umbrella_recommendation", "unknown")
+    t = place.get("type", "tour")
+    if umbrella == "high" and t in ("museum", "mall", "market", "brewery"):
+        score += 30
+    if umbrella == "low" and t in ("beach", "park", "garden"):
+        score += 20
+    temp = weather.get("temp_max") or 25
+    if temp >= 28 and t == "beach":
+        score += 10
+    return score
+
+
+def random_case(rng):
+    weather = {"umbrella_recommendation": rng.choice(UMBRELLAS)}
+    roll = rng.random()
+    if roll < 0.1:
+        weather["temp_max"] = None
+    elif roll < 0.2:
+        weather["temp_max"] = rng.choice((27.9, 28, 28.1, 0))
+    elif roll < 0.9:
+        weather["temp_max"] = round(rng.uniform(-10, 45), 1)
+    places = []
+    for i in range(rng.randint(1, 8)):
+        place = {"name": f"p{i}"}
+        if rng.random() > 0.1:
+            place["type"] = rng.choice(TYPES)
+        places.append(place)
+    return places, weather
+
+
+def test_matrix_matches_reference_scorer():
+    rng = random.Random(20240521)
+    for _ in range(20000):
+        places, weather = random_case(rng)
+        expected = [{"name": p["name"], "score": reference_score(p, weather)} for p in places]
+        assert evaluate_places(places, weather) == expected, (places, weather)
+
+
+def reference_top_k(candidates, weather, k):
+    scored = [(c, reference_score(c, weather)) for c in candidates]
+    # stable sort: ties keep input order
+    return sorted(scored, key=lambda cs: -cs[1])[:k]
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_top_k_is_stable_and_exact(monkeypatch, vectorized):
+    if vectorized and not ranking.NUMPY_AVAILABLE:
+        pytest.skip("numpy not installed")
+    monkeypatch.setattr(ranking, "NUMPY_AVAILABLE", vectorized)
+    monkeypatch.setattr(ranking, "NUMPY_MIN_CANDIDATES", 0)
+    rng = random.Random(7)
+    ranker = Ranker()
+    for _ in range(300):
+        candidates = [{"name": f"c{i}", "type": rng.choice(TYPES)} for i in range(rng.randint(1, 400))]
+        weather = {"umbrella_recommendation": rng.choice(UMBRELLAS), "temp_max": rng.uniform(15, 35)}
+        k = rng.randint(0, 30)
+        got = [(c, int(s)) for c, s in ranker.top_k(candidates, weather, k)]
+        assert got == reference_top_k(candidates, weather, k)
+
+
+def test_numpy_and_heap_paths_agree(monkeypatch):
+    if not ranking.NUMPY_AVAILABLE:
+        pytest.skip("numpy not installed")
+    monkeypatch.setattr(ranking, "NUMPY_MIN_CANDIDATES", 0)
+    rng = random.Random(11)
+    ranker = Ranker()
+    candidates = [{"name": f"c{i}", "type": rng.choice(TYPES)} for i in range(5000)]
+    encoded = ranker.encode(candidates)
+    for umbrella in UMBRELLAS:
+        weather = {"umbrella_recommendation": umbrella, "temp_max": 30}
+        vectorized = [(c, int(s)) for c, s in ranker.top_k(candidates, weather, 25, encoded)]
+        monkeypatch.setattr(ranking, "NUMPY_AVAILABLE", False)
+        heap = ranker.top_k(candidates, weather, 25, encoded)
+        monkeypatch.setattr(ranking, "NUMPY_AVAILABLE", True)
+        assert vectorized == heap
+
+
+def test_top_places_deduplicates_by_name():
+    weather = {"umbrella_recommendation": "high", "temp_max": 20}
+    candidates = [{"name": "A", "type": "park"}, {"name": "B", "type": "museum"}, {"name": "A", "type": "museum"}]
+    assert [c["name"] for c in top_places(candidates, weather, 3)] == ["B", "A"]
+
+
+def test_thresholds_must_be_band_edges():
+    with pytest.raises(ValueError):
+        Ranker(rules=((None, ("beach",), 27, 10),))
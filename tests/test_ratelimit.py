@@ -0,0 +1,90 @@
+import threading
+
+from agents import ratelimit
+from agents.ratelimit import TokenBucket
+
+
+class FakeClock:
+    """Stands in for the `time` module: `sleep` advances `time` instead of blocking."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_burst_then_paced_at_rate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    bucket = TokenBucket(rate=2.0, burst=2.0)
+    waits = [bucket.acquire() for _ in range(5)]
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2:] == [0.5, 0.5, 0.5]
+    assert clock.sleeps == [0.5, 0.5, 0.5]
+    assert bucket.stats()["waited"] == 3
+
+
+def test_waiters_reserve_tokens_in_order(monkeypatch):
+    # without sleeping, each caller reserves the next slot: waits grow by 1/rate
+    clock = FakeClock()
+    monkeypatch.setattr(clock, "sleep", lambda s: None)
+    monkeypatch.setattr(ratelimit, "time", clock)
+    bucket = TokenBucket(rate=1.0)
+    assert [bucket.acquire() for _ in range(4)] == [0.0, 1.0, 2.0, 3.0]
+
+
+def test_refill_is_capped_at_burst(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    bucket = TokenBucket(rate=1.0, burst=1.0)
+    bucket.acquire()
+    clock.now += 60
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 1.0
+
+
+def test_refund_returns_the_token(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    bucket = TokenBucket(rate=1.0)
+    bucket.acquire()
+    bucket.refund()
+    assert bucket.acquire() == 0.0
+
+
+def test_state_is_shared_through_the_file(monkeypatch, tmp_path):
+    clock = FakeClock()
+    monkeypatch.setattr(clock, "sleep", lambda s: None)
+    monkeypatch.setattr(ratelimit, "time", clock)
+    path = str(tmp_path / "bucket")
+    first, second = TokenBucket(rate=1.0, path=path), TokenBucket(rate=1.0, path=path)
+    assert first.acquire() == 0.0
+    assert second.acquire() == 1.0
+    assert first.acquire() == 2.0
+
+
+def test_concurrent_acquires_are_spaced(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(clock, "sleep", lambda s: None)
+    monkeypatch.setattr(ratelimit, "time", clock)
+    bucket = TokenBucket(rate=4.0)
+    waits = []
+    lock = threading.Lock()
+
+    def worker():
+        w = bucket.acquire()
+        with lock:
+            waits.append(w)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(waits) == [i * 0.25 for i in range(8)]